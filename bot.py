@@ -7,18 +7,32 @@ Color Codes for Console Output:
     BLUE  = Process/Info
 """
 
+import asyncio
+import atexit
 import discord
 import responses
-from discord.ext import commands
+import botlog
+import metrics
+import guild_config
+import permissions
+import outbox
+import jobs
+import imagescreen
+import floodguard
+import demoparser
+import demoindex
 from discord.utils import get
 import ticks
 import os
-from moviepy import *
 import random
-import demoparser
-from zipfile import ZipFile
 import datetime
+import hashlib
+import importlib
+import io
 import json
+import time
+import weakref
+from collections import OrderedDict
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -35,34 +49,50 @@ DOWNLOADS_PATH = f"{BASE_PATH}/downloads"
 WR_ARCHIVE_PATH = f"{BASE_PATH}/wr_archive.json"
 CUBE_COUNT_PATH = f"{BASE_PATH}/cube_count.txt"
 
-# Discord channel IDs
-PIN_CHANNEL_ID = 1192784040634351757
-WR_CHANNEL_ID = 1174320230386901023
-MOD_LOG_CHANNEL_ID = 778521955435413514
-
-# Server configuration
-P1SR_SERVER_ID = "305456639530500096"
-REACTION_PIN_THRESHOLD = 10
-
-# Role permissions
-PRIVILEGED_ROLES = ["Community contributor", "SRC verifier", "Moderation Team", "Admin"]
-
-# Security terms from environment
-DOX_TERMS = os.getenv("DOX_TERMS", "").split(",") if os.getenv("DOX_TERMS") else []
-TIMEOUT_TERMS = os.getenv("TIMEOUT_TERMS", "").split(",") if os.getenv("TIMEOUT_TERMS") else []
-
-
-def check_timeout_terms(message):
-    """Check if message contains any timeout terms."""
-    for term in TIMEOUT_TERMS:
-        if term and term in message:
+# Channel IDs, pin threshold, privileged roles and term lists are set per
+# guild in guild_config.json and looked up with guild_config.get()
+
+# Reaction count cache - local counts are trusted until they get within
+# REACTION_RECONCILE_MARGIN of the threshold, then checked against the API
+REACTION_RECONCILE_MARGIN = 2
+REACTION_CACHE_SIZE = 2000
+REACTION_CACHE_TTL = 6 * 60 * 60  # seconds
+
+# Pinned attachments are reposted from memory up to this many bytes in total,
+# anything larger is linked instead
+PIN_ATTACHMENT_MAX_SIZE = 25 * 1024 * 1024
+PIN_MAX_FILES = 10
+
+# How long spammers and raid accounts are timed out for
+FLOOD_TIMEOUT = datetime.timedelta(hours=1)
+
+# Discord client profile - only the gateway events the handlers use are
+# subscribed to and the message cache is capped, so memory doesn't grow
+# without limit as the bot joins more servers
+MAX_CACHED_MESSAGES = int(os.getenv("MAX_CACHED_MESSAGES", "1000"))
+# The members intent is privileged and has to be enabled in the developer
+# portal, without it role changes are picked up when the permission cache expires
+MEMBERS_INTENT = os.getenv("MEMBERS_INTENT", "0") == "1"
+# Run an AutoShardedClient, with SHARD_COUNT shards or as many as Discord recommends
+AUTO_SHARD = os.getenv("AUTO_SHARD", "0") == "1"
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+
+# Local Prometheus-style metrics endpoint, disabled unless METRICS_PORT is set
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+
+def check_timeout_terms(message, guild_id=None):
+    """Check if message contains any of the guild's timeout terms."""
+    for term in guild_config.get(guild_id).timeout_terms:
+        if term in message:
             return True, term
     return False, ""
 
 
-def get_dox_terms():
-    """Get list of dox terms from environment."""
-    return DOX_TERMS
+def get_dox_terms(guild_id=None):
+    """Get the guild's list of dox terms."""
+    return guild_config.get(guild_id).dox_terms
 
 
 # Category mappings for WR archive
@@ -95,7 +125,7 @@ def load_wr_archive():
     except FileNotFoundError:
         return []
     except json.JSONDecodeError as e:
-        print(responses.print_colour("R", f"JSON parse error: {e}"))
+        botlog.error(f"JSON parse error: {e}")
         return []
 
 
@@ -118,7 +148,7 @@ def add_wr_record(name, category, time, date, link):
         "link": link
     })
     save_wr_archive(records)
-    print(responses.print_colour("G", "WR record added successfully"))
+    botlog.success("WR record added successfully")
 
 
 def search_wr_by_name(name):
@@ -151,8 +181,8 @@ def format_wr_record(record):
 # =============================================================================
 
 def has_privileged_role(member):
-    """Check if a member has any privileged role."""
-    return any(str(role) in PRIVILEGED_ROLES for role in member.roles)
+    """Check if a member has any of their guild's privileged roles."""
+    return permissions.is_privileged(member)
 
 
 def sanitize_mentions(content):
@@ -160,6 +190,20 @@ def sanitize_mentions(content):
     return content.replace("@", "@ ") if "@" in content else content
 
 
+def message_guild_id(message):
+    """Guild ID of a message, or None for DMs."""
+    return message.guild.id if message.guild else None
+
+
+def message_fields(message):
+    """Structured log fields describing where a message came from."""
+    return {
+        "guild": message.guild.id if message.guild else None,
+        "channel": message.channel.id,
+        "user": message.author.id,
+    }
+
+
 def contains_ping(text):
     """Check if text contains a ping attempt."""
     return "@" in text
@@ -170,39 +214,236 @@ async def send_message(message, user_message):
     try:
         response = responses.handle_response(message, user_message)
         if response:
-            await message.channel.send(response)
+            await outbox.send(message.channel, response)
     except Exception as e:
-        print(responses.print_colour("R", f"Error sending message: {e}"))
+        botlog.error(f"Error sending message: {e}")
 
 
 # =============================================================================
 # PINNERINO HANDLER
 # =============================================================================
 
+class PinnedMessageStore:
+    """
+    In-memory set of pinned message IDs backed by an append-only file.
+
+    The file is read once on first use. New IDs are buffered and appended
+    by a background task off the event loop, so IDs added while a write is
+    running go out together in the next one. Anything still buffered is
+    written by flush_now() at shutdown.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = None
+        self._pending = []
+        self._flush_task = None
+
+    def _load(self):
+        """Read every recorded message ID from disk."""
+        ids = set()
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.isdigit():
+                        ids.add(int(line))
+        except FileNotFoundError:
+            pass
+        return ids
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = self._load()
+        return self._ids
+
+    def __contains__(self, message_id):
+        return int(message_id) in self.ids
+
+    def add(self, message_id):
+        """Record a message ID and schedule it to be written."""
+        message_id = int(message_id)
+        if message_id in self.ids:
+            return
+        self.ids.add(message_id)
+        self._pending.append(message_id)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not running inside the bot, write straight away
+            self.flush_now()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self.flush())
+
+    def _write(self, message_ids):
+        """Append message IDs to disk and fsync them."""
+        with open(self.path, "a") as f:
+            f.write("".join(f"{message_id}\n" for message_id in message_ids))
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def flush(self):
+        """Append any buffered IDs to disk off the event loop."""
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except OSError as e:
+                # Put them back so the next flush retries the write
+                self._pending[:0] = batch
+                botlog.error(f"Failed to save pinned IDs: {e}")
+                return
+
+    def flush_now(self):
+        """Append any buffered IDs synchronously (used at shutdown)."""
+        if not self._pending:
+            return
+        try:
+            self._write(self._pending)
+        except OSError as e:
+            botlog.error(f"Failed to save pinned IDs: {e}")
+            return
+        self._pending.clear()
+
+
+pinned_messages = PinnedMessageStore(f"{PINNERINO_PATH}/pinnerino_message_ids.txt")
+atexit.register(pinned_messages.flush_now)
+
+
+class ReactionCounter:
+    """
+    Bounded LRU/TTL cache of pin reaction counts per message.
+
+    Counts are seeded from a real fetch the first time a message is seen,
+    then kept up to date from raw reaction add/remove events.
+    """
+
+    def __init__(self, max_size=REACTION_CACHE_SIZE, ttl=REACTION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._counts = OrderedDict()  # message_id -> (count, expires_at)
+
+    def get(self, message_id):
+        """Return the tracked count for a message, or None if unknown."""
+        entry = self._counts.get(message_id)
+        if entry is None:
+            return None
+        count, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._counts[message_id]
+            return None
+        return count
+
+    def set(self, message_id, count):
+        """Store a known count, evicting the least recently used entries."""
+        self._counts[message_id] = (count, time.monotonic() + self.ttl)
+        self._counts.move_to_end(message_id)
+        while len(self._counts) > self.max_size:
+            self._counts.popitem(last=False)
+
+    def adjust(self, message_id, delta):
+        """Apply a reaction add/remove to a tracked message and return the new count."""
+        count = self.get(message_id)
+        if count is None:
+            return None
+        count = max(count + delta, 0)
+        self.set(message_id, count)
+        return count
+
+    def discard(self, message_id):
+        self._counts.pop(message_id, None)
+
+
+reaction_counts = ReactionCounter()
+
+
+def get_cached_message(client, message_id):
+    """Return a message from the client's message cache, or None."""
+    return get(client.cached_messages, id=message_id)
+
+
+# One lock per message being processed, dropped automatically once no
+# handler holds it any more
+pin_locks = weakref.WeakValueDictionary()
+
+
+def get_pin_lock(message_id):
+    """Return the lock serialising pin handling for a message."""
+    lock = pin_locks.get(message_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        pin_locks[message_id] = lock
+    return lock
+
+
+@metrics.timed("pin_reaction")
 async def handle_pin_reaction(client, payload):
     """Handle the pin reaction workflow."""
-    channel = client.get_channel(payload.channel_id)
-    message = await channel.fetch_message(payload.message_id)
-    reaction = get(message.reactions, emoji=payload.emoji.name)
-    
-    if not reaction or reaction.count != REACTION_PIN_THRESHOLD:
+    config = guild_config.get(payload.guild_id)
+    if config.pin_channel_id is None or payload.message_id in pinned_messages:
         return
+
+    # Trust the local count while it is clearly below the threshold
+    count = reaction_counts.adjust(payload.message_id, 1)
+    if count is not None and count < config.reaction_pin_threshold - REACTION_RECONCILE_MARGIN:
+        return
+
+    # Reactions racing on the same message are handled one at a time so it
+    # is only ever pinned once; different messages still run concurrently
+    async with get_pin_lock(payload.message_id):
+        if payload.message_id in pinned_messages:
+            return
+
+        # Reactions on cached messages are kept up to date by the gateway,
+        # so only fall back to the REST API when the message isn't cached
+        message = get_cached_message(client, payload.message_id)
+        if message is None:
+            channel = client.get_channel(payload.channel_id)
+            message = await channel.fetch_message(payload.message_id)
+        reaction = get(message.reactions, emoji=payload.emoji.name)
+        reaction_counts.set(message.id, reaction.count if reaction else 0)
+        
+        if not reaction or reaction.count < config.reaction_pin_threshold:
+            return
+        
+        # Record the message ID
+        pinned_messages.add(message.id)
+        reaction_counts.discard(message.id)
     
-    # Check if already pinned
-    pinned_ids_path = f"{PINNERINO_PATH}/pinnerino_message_ids.txt"
-    try:
-        with open(pinned_ids_path, "r") as f:
-            if any(str(message.id) == line.strip() for line in f):
-                return
-    except FileNotFoundError:
-        pass
-    
-    # Record the message ID
-    with open(pinned_ids_path, "a") as f:
-        f.write(f"{message.id}\n")
-    
-    # Prepare and send the pin
-    pin_channel = client.get_channel(PIN_CHANNEL_ID)
+    await send_pin(client, message, config)
+
+
+async def read_pin_attachments(attachments, size_limit):
+    """
+    Read attachments into memory for reposting.
+
+    Attachments are taken in order until size_limit bytes are used up or
+    Discord's per-message file limit is reached. Anything that doesn't fit
+    is returned as a list of URLs to link instead.
+    """
+    files = []
+    overflow = []
+    remaining = size_limit
+    for attachment in attachments:
+        if attachment.size > remaining or len(files) >= PIN_MAX_FILES:
+            overflow.append(attachment.url)
+            continue
+        try:
+            data = await attachment.read()
+        except discord.HTTPException as e:
+            botlog.error(f"Failed to read attachment: {e}")
+            overflow.append(attachment.url)
+            continue
+        remaining -= len(data)
+        files.append(discord.File(io.BytesIO(data), filename=attachment.filename, spoiler=attachment.is_spoiler()))
+    return files, overflow
+
+
+async def send_pin(client, message, config):
+    """Repost a pinned message to the guild's pin channel in a single send."""
+    pin_channel = client.get_channel(config.pin_channel_id)
     content = sanitize_mentions(str(message.content))
     pin_embed = discord.Embed(
         title=str(message.author).capitalize(),
@@ -210,100 +451,333 @@ async def handle_pin_reaction(client, payload):
         color=0xFF0000
     )
     message_link = responses.generate_message_link(message.guild.id, message.channel.id, message.id)
+    files = []
     
     # Handle different attachment types
     if message.attachments:
-        attachment = message.attachments[0]
-        filename = attachment.filename
-        
-        if filename.endswith(".mp4"):
-            save_path = f"{PINNERINO_PATH}/pinnerino.mp4"
-        else:
-            save_path = f"{PINNERINO_PATH}/pinnerino.jpg"
-        
-        await attachment.save(save_path)
-        await pin_channel.send(embed=pin_embed)
-        await pin_channel.send(file=discord.File(save_path))
-        await pin_channel.send(message_link)
+        size_limit = min(PIN_ATTACHMENT_MAX_SIZE, pin_channel.guild.filesize_limit)
+        files, overflow = await read_pin_attachments(message.attachments, size_limit)
+        pin_content = "\n".join(overflow + [message_link])
     
     elif "https://tenor.com/view/" in message.content or ".gif" in message.content:
         pin_embed.description = "SENT GIF"
-        await pin_channel.send(embed=pin_embed)
-        await pin_channel.send(message.content)
-        await pin_channel.send(message_link)
+        pin_content = f"{message.content}\n{message_link}"
     
     else:
-        await pin_channel.send(embed=pin_embed)
-        await pin_channel.send(message_link)
+        pin_content = message_link
+    
+    await outbox.send(pin_channel, pin_content, embed=pin_embed, files=files)
+
+
+# =============================================================================
+# MODERATION
+# =============================================================================
+
+@metrics.timed("moderation")
+async def handle_security_checks(client, message, username, user_message):
+    """Run the dox and timeout checks, returns True if the message was removed."""
+    config = guild_config.get(message_guild_id(message))
+    
+    # Check for dox in message
+    if responses.text_dox_blox(user_message, config.dox_terms):
+        botlog.error(responses.error_message("301"), code="301", **message_fields(message))
+        await message.author.ban(reason="Potential Dox Detected")
+        await message.delete()
+        return True
+    
+    # Check for dox in username
+    if responses.name_dox_blox(username, config.dox_terms):
+        botlog.error(responses.error_message("302"), code="302", **message_fields(message))
+        await message.author.ban(reason="Potential Dox Detected")
+        await message.delete()
+        return True
+    
+    # Check for dox in images, moderators post blocked images to add them
+    if message.attachments and not has_privileged_role(message.author):
+        entry = await imagescreen.screen_attachments(message.attachments)
+        if entry is not None:
+            botlog.error(responses.error_message("303"), code="303", dhash=entry["dhash"], **message_fields(message))
+            await message.author.ban(reason="Potential Dox Detected")
+            await message.delete()
+            return True
+    
+    # Check for timeout terms
+    has_timeout, timeout_term = check_timeout_terms(user_message, message_guild_id(message))
+    if has_timeout:
+        botlog.error(responses.error_message("305"), code="305", term=timeout_term, **message_fields(message))
+        await timeout_member(client, message, config, datetime.timedelta(days=1),
+                             "Timeout Term Detected in message", f"`{timeout_term}`")
+    
+    # Check for one user spamming or many users posting the same thing
+    if message.guild is not None and not has_privileged_role(message.author):
+        flood = floodguard.flood_guard.check(message.guild.id, message.author.id, user_message,
+                                             config.flood_user_limit, config.flood_content_limit)
+        if flood is not None:
+            botlog.error(responses.error_message("306"), code="306", kind=flood, **message_fields(message))
+            await timeout_member(client, message, config, FLOOD_TIMEOUT,
+                                 f"Flood Detected ({flood})", "flooding" if flood == "spam" else "raid messages")
+            return True
+    
+    return False
+
+
+async def timeout_member(client, message, config, duration, reason, log_reason):
+    """Time out a message's author, delete the message and report it in the mod log."""
+    try:
+        timeout_until = datetime.datetime.now(datetime.timezone.utc) + duration
+        await message.author.timeout(timeout_until, reason=reason)
+        await message.delete()
+        mod_channel = client.get_channel(config.mod_log_channel_id)
+        await outbox.send(mod_channel, f"Timed out {message.author.mention} for {log_reason}")
+    except:
+        botlog.error("Timeout Failed (Likely missing permissions)")
+
+
+async def handle_block_image(message):
+    """
+    Add images to the dox image blocklist (privileged users only).
+
+    Blocks the images attached to the command, or to the message it replies to,
+    and deletes the replied-to message.
+    """
+    if not has_privileged_role(message.author):
+        return
+
+    target = None
+    if message.reference and message.reference.message_id:
+        target = message.reference.resolved
+        if not isinstance(target, discord.Message):
+            try:
+                target = await message.channel.fetch_message(message.reference.message_id)
+            except discord.NotFound:
+                await outbox.send(message.channel, "Couldn't find the message you replied to, "
+                                  "attach the image instead!", reference=message)
+                return
+
+    attachments = [a for a in message.attachments + (target.attachments if target else []) if imagescreen.is_image(a)]
+    if not attachments:
+        await outbox.send(message.channel, "Attach an image or reply to one to block it!", reference=message)
+        return
+
+    added = []
+    for attachment in attachments:
+        ahash, dhash = await imagescreen.blocklist.hash_image(await attachment.read())
+        if imagescreen.blocklist.add(ahash, dhash, str(message.author), attachment.filename):
+            added.append(f"{dhash:016x}")
+    botlog.info(f"{message.author} blocked {len(added)} image(s)", **message_fields(message))
+
+    if target is not None:
+        await target.delete()
+    if message.attachments:
+        await message.delete()
+    await outbox.send(message.channel, f"Blocked {len(added)} image(s): {', '.join(added) or 'already blocked'}")
+
+
+async def handle_unblock_image(message, user_message):
+    """Remove an image from the dox image blocklist by its hash (privileged users only)."""
+    if not has_privileged_role(message.author):
+        return
+    parts = user_message.split()
+    if len(parts) < 2:
+        await outbox.send(message.channel, "Usage: `unblockimage++ <hash>`", reference=message)
+        return
+    if imagescreen.blocklist.remove(parts[1]):
+        await outbox.send(message.channel, f"Unblocked {parts[1]}", reference=message)
+    else:
+        await outbox.send(message.channel, f"{parts[1]} isn't blocked", reference=message)
 
 
 # =============================================================================
 # VIDEO CONVERSION HANDLER
 # =============================================================================
 
-async def handle_mkv_conversion(message, filename):
-    """Convert MKV files to MP4 format."""
+def convert_video(input_path, output_path, resized_path):
+    """Convert an MKV file to a resized MP4, blocking, run in a worker thread."""
+    # Rename to MP4 (container change)
+    botlog.info("Converting to MP4...")
+    os.rename(input_path, output_path)
+
+    # moviepy pulls in numpy, imageio and ffmpeg probing, so it is only
+    # imported the first time a video actually needs converting
+    moviepy = importlib.import_module("moviepy")
+    clip = moviepy.VideoFileClip(output_path)
+    file_size = os.path.getsize(output_path)
+    botlog.info(f"{file_size} bytes")
+
+    # Determine resolution based on file size
+    if file_size > 30000000:
+        botlog.info("Converting to 240p")
+        resized_clip = clip.resized(width=427, height=240)
+    elif file_size > 20000000:
+        botlog.info("Converting to 480p")
+        resized_clip = clip.resized(width=854, height=480)
+    else:
+        botlog.info("Converting to 720p")
+        resized_clip = clip.resized(width=1280, height=720)
+
+    resized_clip.write_videofile(resized_path)
+    clip.close()
+    botlog.success("Converted Successfully")
+
+
+def hash_file(path):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def fetch_job_message(client, job):
+    """Fetch a job's source message and attachment again, the stored CDN URL may have expired."""
+    channel = client.get_channel(job.channel_id) or await client.fetch_channel(job.channel_id)
+    message = await channel.fetch_message(job.message_id)
+    attachment = get(message.attachments, filename=job.filename)
+    if attachment is None:
+        raise ValueError(f"Attachment {job.filename} is no longer on message {job.message_id}")
+    return message, attachment
+
+
+@metrics.timed("mkv_conversion")
+async def handle_mkv_conversion(client, job):
+    """
+    Convert an MKV attachment to MP4 format, run by the job queue.
+
+    Each job gets its own files in the downloads folder so conversions
+    can't overwrite each other.
+
+    Returns:
+        Link to the converted video, stored as the job's output
+    """
+    message, attachment = await fetch_job_message(client, job)
+
+    input_path = f"{DOWNLOADS_PATH}/job{job.id}_input.mkv"
+    output_path = f"{DOWNLOADS_PATH}/job{job.id}_output.mp4"
+    resized_path = f"{DOWNLOADS_PATH}/job{job.id}_resized.mp4"
     try:
-        await message.channel.send("Converting to MP4...")
-        
-        input_path = f"{DOWNLOADS_PATH}/input_video.mkv"
-        output_path = f"{DOWNLOADS_PATH}/output_video.mp4"
-        resized_path = f"{DOWNLOADS_PATH}/resized_output_video.mp4"
-        
         # Download the file
-        print(responses.print_colour("B", "Downloading Video..."))
-        await message.attachments[0].save(input_path)
-        print(responses.print_colour("G", "Downloaded"))
-        
-        # Rename to MP4 (container change)
-        print(responses.print_colour("B", "Converting to MP4..."))
-        os.rename(input_path, output_path)
-        
-        # Determine resolution based on file size
-        clip = VideoFileClip(output_path)
-        file_size = os.path.getsize(output_path)
-        print(responses.print_colour("B", f"{file_size} bytes"))
-        
-        if file_size > 30000000:
-            print(responses.print_colour("B", "Converting to 240p"))
-            resized_clip = clip.resized(width=427, height=240)
-        elif file_size > 20000000:
-            print(responses.print_colour("B", "Converting to 480p"))
-            resized_clip = clip.resized(width=854, height=480)
-        else:
-            print(responses.print_colour("B", "Converting to 720p"))
-            resized_clip = clip.resized(width=1280, height=720)
-        
-        resized_clip.write_videofile(resized_path)
-        clip.close()
-        print(responses.print_colour("G", "Converted Successfully"))
-        
-        await message.channel.send("Converted Successfully!", file=discord.File(resized_path))
-        
+        botlog.info("Downloading Video...")
+        await attachment.save(input_path)
+        botlog.success("Downloaded")
+
+        # The same video posted again just gets a link to the first conversion
+        earlier = jobs.job_queue.record_content(job, await asyncio.to_thread(hash_file, input_path))
+        if earlier:
+            await outbox.send(message.channel, f"This video was already converted: {earlier}", reference=message)
+            return earlier
+
+        await asyncio.to_thread(convert_video, input_path, output_path, resized_path)
+        result = await outbox.send(message.channel, "Converted Successfully!", file=discord.File(resized_path),
+                                   reference=message)
+        return result.jump_url
+    finally:
         # Cleanup
-        os.remove(output_path)
-        os.remove(resized_path)
-        
-    except Exception as e:
-        print(responses.print_colour("R", str(e)))
-        await message.channel.send("Something went wrong!!! :((")
-        # Cleanup on error
-        for path in [f"{DOWNLOADS_PATH}/input_video.mkv", 
-                     f"{DOWNLOADS_PATH}/output_video.mp4",
-                     f"{DOWNLOADS_PATH}/resized_output_video.mp4"]:
+        for path in [input_path, output_path, resized_path]:
             try:
                 os.remove(path)
-            except:
+            except OSError:
                 pass
 
 
+async def handle_mkv_failure(client, job, error):
+    """Tell the user once their conversion has failed every attempt."""
+    channel = client.get_channel(job.channel_id)
+    if channel is not None:
+        await outbox.send(channel, "Something went wrong!!! :((")
+
+
+# =============================================================================
+# DEMO HANDLERS
+# =============================================================================
+
+@metrics.timed("demo_job")
+async def handle_demo_parse(client, job):
+    """
+    Parse a demo attachment and add it to the demo index, run by the job queue.
+
+    Returns:
+        Link to the parse result, stored as the job's output
+    """
+    message, attachment = await fetch_job_message(client, job)
+    data = await attachment.read()
+    content_hash = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+
+    # The same demo posted again is answered from the index
+    known = demoindex.demo_index.get(content_hash)
+    if known is not None:
+        await outbox.send(message.channel, f"This demo was already parsed: {demoindex.format_demo(known)}",
+                          reference=message)
+        return known["link"]
+
+    parser = demoparser.Parser(data)
+    parsed = await asyncio.to_thread(parser.parse_demo)
+    if parser.demo.file_stamp != "HL2DEMO\0":
+        await outbox.send(message.channel, f"{job.filename} doesn't look like a demo file!", reference=message)
+        return None
+    if not parsed:
+        # Cut short or corrupted, don't index a partial tick count
+        await outbox.send(message.channel, f"{job.filename} looks incomplete or corrupted, couldn't parse it!", reference=message)
+        return None
+
+    demoindex.demo_index.add(content_hash, parser.demo, job.filename, job.guild_id, message.jump_url)
+    result = await outbox.send(message.channel, embed=parser.generate_embed(job.filename), reference=message)
+    return result.jump_url
+
+
+async def handle_demo_failure(client, job, error):
+    """Tell the user once their demo has failed to parse every attempt."""
+    channel = client.get_channel(job.channel_id)
+    if channel is not None:
+        await outbox.send(channel, f"Couldn't parse {job.filename} :(")
+
+
+async def handle_demo_command(message, user_message):
+    """Demo index search commands."""
+    if contains_ping(user_message):
+        botlog.error(responses.error_message("304"), code="304", **message_fields(message))
+        return
+    
+    args = user_message.split(maxsplit=3)
+
+    if len(args) >= 4 and args[1].lower() == "search" and args[2].lower() in ("map", "player"):
+        if args[2].lower() == "map":
+            rows = demoindex.demo_index.search_map(args[3])
+        else:
+            rows = demoindex.demo_index.search_player(args[3])
+        if not rows:
+            await outbox.send(message.channel, f"No demos found for {args[2].lower()} `{args[3]}`")
+            return
+        lines = [f"{i}. {demoindex.format_demo(row)}" for i, row in enumerate(rows, 1)]
+        await outbox.send(message.channel, f"**Demos for {args[2].lower()} `{args[3]}`**\n" + "\n".join(lines))
+    
+    elif len(args) >= 3 and args[1].lower() == "best":
+        map_name = " ".join(args[2:])
+        row = demoindex.demo_index.best(map_name)
+        if row is None:
+            await outbox.send(message.channel, f"No demos found for `{map_name}`")
+            return
+        await outbox.send(message.channel, f"**Best demo on `{row['map_name']}`**\n{demoindex.format_demo(row)}")
+    
+    else:
+        await outbox.send(message.channel, """
+**Demo Commands**
+
+`demo++ search map <name>` - Lists the fastest parsed demos on maps starting with name
+`demo++ search player <name>` - Lists the fastest parsed demos by a player
+`demo++ best <map>` - Shows the fastest parsed demo on a map
+
+Post a `.dem` file to parse it and add it to the index.
+""")
+
+
 # =============================================================================
 # WR COMMAND HANDLERS
 # =============================================================================
 
 async def handle_wr_help(message):
     """Display WR command help."""
-    await message.channel.send("""
+    await outbox.send(message.channel, """
 **wr++ Help Manual**
 
 **Usage:**
@@ -323,10 +797,11 @@ async def handle_wr_help(message):
 """)
 
 
+@metrics.timed("wr_search")
 async def handle_wr_search(message, args):
     """Handle WR search commands."""
     if len(args) < 4:
-        await message.channel.send("Invalid search format. Use `wr++ help` for usage.")
+        await outbox.send(message.channel, "Invalid search format. Use `wr++ help` for usage.")
         return
     
     search_type = args[2].lower()
@@ -334,20 +809,20 @@ async def handle_wr_search(message, args):
     
     # Perform search based on type
     if search_type == "name":
-        await message.channel.send(f"Searching for name {search_term}...")
+        await outbox.send(message.channel, f"Searching for name {search_term}...")
         results = search_wr_by_name(search_term)
     elif search_type == "category":
-        await message.channel.send(f"Searching for category {search_term}...")
+        await outbox.send(message.channel, f"Searching for category {search_term}...")
         results = search_wr_by_category(search_term)
     elif search_type == "year":
-        await message.channel.send(f"Searching for year {search_term}...")
+        await outbox.send(message.channel, f"Searching for year {search_term}...")
         results = search_wr_by_year(search_term)
     else:
-        await message.channel.send("Invalid search type. Use `wr++ help` for usage.")
+        await outbox.send(message.channel, "Invalid search type. Use `wr++ help` for usage.")
         return
     
     if not results:
-        await message.channel.send("No results found. Use `wr++ help` for more information :)")
+        await outbox.send(message.channel, "No results found. Use `wr++ help` for more information :)")
         return
     
     # Format results (split into chunks to avoid Discord message limits)
@@ -361,10 +836,10 @@ async def handle_wr_search(message, args):
         else:
             output_2 += formatted
     
-    await message.author.send(f"**WR ARCHIVE SEARCH FOR '{search_term}'**\n{output_1}")
+    await outbox.send(message.author, f"**WR ARCHIVE SEARCH FOR '{search_term}'**\n{output_1}")
     if output_2:
-        await message.author.send(output_2)
-    await message.channel.send("Finished! Found WRs will be sent to your DMs :)")
+        await outbox.send(message.author, output_2)
+    await outbox.send(message.channel, "Finished! Found WRs will be sent to your DMs :)")
 
 
 async def handle_wr_post(client, message, args):
@@ -373,20 +848,20 @@ async def handle_wr_post(client, message, args):
         return
     
     if len(args) < 6:
-        await message.channel.send("Invalid format. Expected: wr++ <name> <category> <time> <date> <link>")
+        await outbox.send(message.channel, "Invalid format. Expected: wr++ <name> <category> <time> <date> <link>")
         return
     
     try:
         # Parse arguments
         wr_name = args[1]
         wr_category = args[2].lower()
-        wr_time = args[3]
+        wr_time = ticks.normalize_time(args[3])
         wr_date = args[4]
         wr_link = args[5]
         
         # Validate category
         if wr_category not in CATEGORY_ALIASES:
-            await message.channel.send(f"Invalid category. Valid options: {', '.join(CATEGORY_ALIASES.keys())}")
+            await outbox.send(message.channel, f"Invalid category. Valid options: {', '.join(CATEGORY_ALIASES.keys())}")
             return
         
         # Try to download the attached image
@@ -394,8 +869,8 @@ async def handle_wr_post(client, message, args):
         try:
             await message.attachments[0].save(wr_image_path)
         except:
-            responses.print_colour("R", "No Image Attached")
-            await message.channel.send("Please attach an image with the WR!")
+            botlog.error("No Image Attached")
+            await outbox.send(message.channel, "Please attach an image with the WR!")
             return
         
         # Get full category name for the announcement
@@ -403,31 +878,31 @@ async def handle_wr_post(client, message, args):
         category_name = CATEGORY_FULL_NAMES[normalized_category]
         
         # Post to WR channel
-        wr_channel = client.get_channel(WR_CHANNEL_ID)
+        wr_channel = client.get_channel(guild_config.get(message_guild_id(message)).wr_channel_id)
         announcement = (
             f"[{wr_date}] {wr_name.capitalize()} just got a World Record "
             f"{category_name} run in {wr_time}! Congratulations :tada: {wr_link}"
         )
-        await wr_channel.send(announcement, file=discord.File(wr_image_path))
+        await outbox.send(wr_channel, announcement, file=discord.File(wr_image_path))
         
         # Add to archive
         add_wr_record(wr_name, wr_category, wr_time, wr_date, wr_link)
         
     except Exception as e:
-        print(responses.print_colour("R", str(e)))
-        await message.channel.send("Oops! Something went wrong :(. Please contact developer for more information!")
+        botlog.error(str(e))
+        await outbox.send(message.channel, "Oops! Something went wrong :(. Please contact developer for more information!")
 
 
 async def handle_wr_command(client, message, user_message):
     """Main WR command router."""
     if contains_ping(user_message):
-        print(responses.print_error("304"))
+        botlog.error(responses.error_message("304"), code="304")
         return
     
     args = user_message.split()
     
     if len(args) < 2:
-        await message.channel.send("Use `wr++ help` for usage information.")
+        await outbox.send(message.channel, "Use `wr++ help` for usage information.")
         return
     
     subcommand = args[1].lower()
@@ -445,19 +920,130 @@ async def handle_wr_command(client, message, user_message):
 # MAIN BOT
 # =============================================================================
 
-def run_discord_bot():
-    """Initialize and run the Discord bot."""
-    
-    intents = discord.Intents.default()
+# =============================================================================
+# STARTUP TIMING
+# =============================================================================
+
+# Seconds spent in each startup phase, "import" is filled in by main.py
+startup_times = {}
+connect_start = None
+
+
+def print_startup_report():
+    """Print how long each startup phase took."""
+    total = sum(startup_times.values())
+    phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_times.items())
+    botlog.info(f"Startup took {total:.2f}s ({phases})")
+
+
+# =============================================================================
+# CLIENT PROFILE
+# =============================================================================
+
+def client_intents():
+    """Intents for just the events the bot handles."""
+    intents = discord.Intents.none()
+    intents.guilds = True  # Channels and roles for pins, WR posts and permissions
+    intents.guild_messages = True
+    intents.dm_messages = True
     intents.message_content = True
-    client = discord.Client(intents=intents)
+    intents.guild_reactions = True  # Pinnerino
+    intents.members = MEMBERS_INTENT  # Role changes for the permission cache
+    return intents
+
+
+def client_options():
+    """Keyword arguments for the Discord client."""
+    intents = client_intents()
+    options = {
+        "intents": intents,
+        "max_messages": MAX_CACHED_MESSAGES,
+        # Members are only cached if the members intent is on, and then only
+        # as they join or change, never by downloading whole member lists
+        "member_cache_flags": discord.MemberCacheFlags.from_intents(intents),
+        "chunk_guilds_at_startup": False,
+    }
+    if AUTO_SHARD and SHARD_COUNT:
+        options["shard_count"] = SHARD_COUNT
+    return options
+
+
+def shard_latencies(client):
+    """(shard_id, latency in seconds) for each of the client's shards."""
+    if isinstance(client, discord.AutoShardedClient):
+        return client.latencies
+    return [(client.shard_id or 0, client.latency)]
+
+
+def register_client_gauges(client):
+    """Expose memory per guild and per-shard latency and guild counts as metrics."""
+    def memory_per_guild():
+        rss = metrics.resident_memory()
+        return rss // len(client.guilds) if rss is not None and client.guilds else None
+
+    metrics.register_gauge("resident_memory_per_guild_bytes", memory_per_guild)
+    metrics.register_gauge("guilds", lambda: len(client.guilds))
+    for shard_id, _ in shard_latencies(client):
+        metrics.register_gauge(f"shard_{shard_id}_latency_seconds",
+                               lambda shard_id=shard_id: dict(shard_latencies(client)).get(shard_id))
+        metrics.register_gauge(f"shard_{shard_id}_guilds",
+                               lambda shard_id=shard_id: sum(guild.shard_id == shard_id for guild in client.guilds))
+
+
+def render_client_summary(client):
+    """Memory, guild and shard line for stats++."""
+    guilds = len(client.guilds)
+    rss = metrics.resident_memory()
+    if rss is None:
+        memory = "memory: unknown"
+    else:
+        memory = f"memory: {rss / 2 ** 20:.1f}MiB RSS"
+        if guilds:
+            memory += f" ({rss / guilds / 2 ** 20:.1f}MiB per guild)"
+    shards = ", ".join(f"#{shard_id} {latency * 1000:.0f}ms" for shard_id, latency in shard_latencies(client))
+    return f"{memory}, {guilds} guild{'' if guilds == 1 else 's'}, shards: {shards}"
+
+
+def create_client(client_class=None):
+    """
+    Create a client with all of the bot's event handlers registered.
+
+    client_class lets the offline load tester swap in its fake client, by
+    default it is an AutoShardedClient if AUTO_SHARD is set.
+    """
+    if client_class is None:
+        client_class = discord.AutoShardedClient if AUTO_SHARD else discord.Client
+    client = client_class(**client_options())
+    metrics.instrument_http(client)
+    background_tasks = set()
+    jobs.job_queue.register("mkv", handle_mkv_conversion, on_failure=handle_mkv_failure)
+    jobs.job_queue.register("demo", handle_demo_parse, workers=2, on_failure=handle_demo_failure)
 
     @client.event
     async def on_ready():
         """Called when the bot successfully connects."""
         activity = discord.Game(name="Get started with help++!")
         await client.change_presence(status=discord.Status.online, activity=activity)
-        print(f"{client.user} is now running!")
+        botlog.success(f"{client.user} is now running!")
+        
+        # on_ready fires again after reconnects, only report the first start
+        if "connect" not in startup_times and connect_start is not None:
+            startup_times["connect"] = time.perf_counter() - connect_start
+            print_startup_report()
+            background_tasks.add(asyncio.create_task(metrics.monitor_event_loop()))
+            jobs.job_queue.start(client)
+            register_client_gauges(client)
+            if METRICS_PORT:
+                background_tasks.add(await metrics.serve_metrics(METRICS_HOST, METRICS_PORT))
+                botlog.success(f"Serving metrics on {METRICS_HOST}:{METRICS_PORT}")
+
+    @client.event
+    async def on_shard_disconnect(shard_id):
+        metrics.increment(f"shard_{shard_id}_disconnects")
+
+    @client.event
+    async def on_shard_resumed(shard_id):
+        metrics.increment(f"shard_{shard_id}_resumes")
 
     @client.event
     async def on_raw_reaction_add(payload):
@@ -466,88 +1052,110 @@ def run_discord_bot():
             await handle_pin_reaction(client, payload)
 
     @client.event
+    async def on_raw_reaction_remove(payload):
+        """Keep tracked pin reaction counts in sync."""
+        if payload.emoji.name == "📌":
+            reaction_counts.adjust(payload.message_id, -1)
+
+    @client.event
+    async def on_member_update(before, after):
+        """Drop cached permissions when a member's roles change."""
+        if before.roles != after.roles:
+            permissions.permission_cache.invalidate_member(after.guild.id, after.id)
+
+    @client.event
+    async def on_guild_role_create(role):
+        permissions.permission_cache.refresh_guild(role.guild)
+
+    @client.event
+    async def on_guild_role_update(before, after):
+        permissions.permission_cache.refresh_guild(after.guild)
+
+    @client.event
+    async def on_guild_role_delete(role):
+        permissions.permission_cache.refresh_guild(role.guild, deleted_role_id=role.id)
+
+    @client.event
+    @metrics.timed("on_message")
     async def on_message(message):
         """Handle incoming messages."""
+        start = time.perf_counter()
+        
         # Ignore self
         if message.author == client.user:
             return
         
+        if message.guild is not None:
+            metrics.increment(f"shard_{message.guild.shard_id}_messages")
+        
         # Ignore ANSI escape sequences (ESC character is \x1b)
         if "\x1b" in message.content:
-            print(responses.print_error("201"))
+            botlog.error(responses.error_message("201"), code="201", **message_fields(message))
             return
         
         username = str(message.author)
         user_message = str(message.content)
         channel = str(message.channel)
         
-        try:
-            message_server_id = str(message.guild.id)
-        except:
-            message_server_id = "0"
+        config = guild_config.get(message_guild_id(message))
         
         # =================================================================
         # SECURITY CHECKS
         # =================================================================
         
-        # Check for dox in message
-        if responses.text_dox_blox(user_message):
-            print(responses.print_error("301"))
-            await message.author.ban(reason="Potential Dox Detected")
-            await message.delete()
+        if await handle_security_checks(client, message, username, user_message):
             return
         
-        # Check for dox in username
-        if responses.name_dox_blox(username):
-            print(responses.print_error("302"))
-            await message.author.ban(reason="Potential Dox Detected")
-            await message.delete()
-            return
-        
-        # Check for timeout terms
-        has_timeout, timeout_term = check_timeout_terms(user_message)
-        if has_timeout:
-            try:
-                print(responses.print_error("305"))
-                print(message.author)
-                timeout_until = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
-                await message.author.timeout(timeout_until, reason="Timeout Term Detected in message")
-                await message.delete()
-                mod_channel = client.get_channel(MOD_LOG_CHANNEL_ID)
-                await mod_channel.send(f"Timed out {message.author.mention} for `{timeout_term}`")
-            except:
-                print(responses.print_colour("R", "Timeout Failed (Likely missing permissions)"))
-        
         # =================================================================
         # COMMANDS
         # =================================================================
         
         lower_message = user_message.lower()
         
-        # Emergency Exit (P1SR server only, privileged users)
-        if user_message == "emergencyexit++" and message_server_id == P1SR_SERVER_ID:
+        # Emergency Exit (enabled guilds only, privileged users)
+        if user_message == "emergencyexit++" and config.emergency_exit_enabled:
             if has_privileged_role(message.author):
-                await message.channel.send("Shutting Down...")
+                await outbox.send(message.channel, "Shutting Down...")
+                await responses.cube_counter.flush()
                 exit()
         
         # Help Manual
         if lower_message.startswith("help++"):
-            await message.channel.send("""
+            await outbox.send(message.channel, """
 **Help Manual**
 
 `help++` - Displays this help manual
 `cube++` - Increments cube count (Community Contributor+ Only)
 `cube--` - Decrements cube count (Community Contributor+ Only)
 `wr++` - Tools for the WR archive *[WIP]*
-`time2tick++ <time>` - Converts + Validates time to ticks
-`tick2time++ <ticks>` - Converts ticks to time
+`demo++` - Search parsed demos by map or player
+`time2tick++ <time> [time ...]` - Converts + Validates time(s) to ticks
+`tick2time++ <ticks> [ticks ...]` - Converts ticks to time(s)
+`stats++` - Shows handler latency stats
+`blockimage++` - Blocks the attached or replied-to image (Moderator Only)
+`unblockimage++ <hash>` - Unblocks an image (Moderator Only)
 `emergencyexit++` - Shuts down the bot (Moderator Only)
 """)
         
+        # Image blocklist management
+        if lower_message.startswith("blockimage++"):
+            await handle_block_image(message)
+        elif lower_message.startswith("unblockimage++"):
+            await handle_unblock_image(message, user_message)
+        
+        # Handler latency stats
+        if lower_message.startswith("stats++"):
+            # The summary is capped on its own, the rest goes in a second
+            # message so a long summary can't push the reply past 2000
+            await outbox.send(message.channel, metrics.render_summary())
+            await outbox.send(message.channel, "\n".join([
+                jobs.job_queue.summary(), ticks.conversion_cache_summary(), render_client_summary(client),
+            ]))
+        
         # Easter egg: 4104 reaction
         if "4104" in user_message:
             if random.randint(1, 10) == 1:
-                print(responses.print_colour("B", "4104 easter egg triggered!"))
+                botlog.info("4104 easter egg triggered!")
                 await message.add_reaction("<:no4104:1180929144977117364>")
         
         # DM Command (Valoix only)
@@ -558,50 +1166,74 @@ def run_discord_bot():
                 content = " ".join(parts[2:])
                 target_user = await client.fetch_user(user_id)
                 
-                print(responses.print_colour("B", f"DM to {target_user} ({user_id}): {content}"))
-                await target_user.send(content)
-                print(responses.print_colour("G", "DM Sent!"))
+                botlog.info(f"DM to {target_user} ({user_id}): {content}")
+                await outbox.send(target_user, content)
+                botlog.success("DM Sent!")
             except Exception as e:
-                print(responses.print_error("000"))
-                print(responses.print_colour("R", str(e)))
+                botlog.error(responses.error_message("000"), code="000")
+                botlog.error(str(e))
         
         # Tick to Time Conversion
         if lower_message.startswith(("tick2time++", "ticks2time++", "tk2tm++")):
             parts = user_message.split()
-            print(responses.print_colour("B", str(parts)))
+            botlog.info(str(parts))
             
             if len(parts) < 2:
-                await message.reply("Please provide a tick count!")
+                await outbox.send(message.channel, "Please provide a tick count!", reference=message)
                 return
             
             if contains_ping(parts[1]):
-                print(responses.print_error("304"))
+                botlog.error(responses.error_message("304"), code="304")
+                return
+            
+            # Several values (e.g. a pasted split table) get one combined reply
+            if len(parts) > 2:
+                values = ticks.split_values(" ".join(parts[1:]), ticks.TICK_PATTERN)
+                if not values:
+                    await outbox.send(message.channel, "No valid tick counts found, please try again!", reference=message)
+                    return
+                try:
+                    await outbox.send(message.channel, ticks.tick_to_time_batch(values), reference=message)
+                except:
+                    await outbox.send(message.channel, "Some of those tick counts were not valid, please try again!", reference=message)
                 return
             
             try:
                 result = ticks.tick_to_time(parts[1])
-                await message.reply(result)
+                await outbox.send(message.channel, result, reference=message)
             except:
-                await message.reply(f'Your ticks "{parts[1]}" was not a valid tick count, please try again!')
+                await outbox.send(message.channel, f'Your ticks "{parts[1]}" was not a valid tick count, please try again!', reference=message)
         
         # Time to Tick Conversion
         if lower_message.startswith(("time2tick++", "time2ticks++", "tm2tk++")):
             parts = user_message.split()
-            print(responses.print_colour("B", str(parts)))
+            botlog.info(str(parts))
             
             if len(parts) < 2:
-                await message.reply("Please provide a time!")
+                await outbox.send(message.channel, "Please provide a time!", reference=message)
                 return
             
             if contains_ping(parts[1]):
-                print(responses.print_error("304"))
+                botlog.error(responses.error_message("304"), code="304")
+                return
+            
+            # Several values (e.g. a pasted split table) get one combined reply
+            if len(parts) > 2:
+                values = ticks.split_values(" ".join(parts[1:]), ticks.TIME_PATTERN)
+                if not values:
+                    await outbox.send(message.channel, "No valid times found, please try again!", reference=message)
+                    return
+                try:
+                    await outbox.send(message.channel, ticks.time_to_tick_batch(values), reference=message)
+                except:
+                    await outbox.send(message.channel, "Some of those times were not valid, please try again!", reference=message)
                 return
             
             try:
                 result = ticks.time_to_tick(parts[1])
-                await message.reply(result)
+                await outbox.send(message.channel, result, reference=message)
             except:
-                await message.reply(f'Your time "{parts[1]}" was not a valid time, please try again!')
+                await outbox.send(message.channel, f'Your time "{parts[1]}" was not a valid time, please try again!', reference=message)
         
         # =================================================================
         # ATTACHMENT HANDLING
@@ -609,16 +1241,26 @@ def run_discord_bot():
         
         try:
             if message.attachments:
-                filename = message.attachments[0].filename
-                
-                # MKV to MP4 conversion
-                if filename.endswith(".mkv"):
-                    await handle_mkv_conversion(message, filename)
+                # MKV to MP4 conversion and demo parsing, queued so they survive a restart
+                for attachment in message.attachments:
+                    if attachment.filename.endswith(".mkv"):
+                        if jobs.job_queue.enqueue("mkv", message, attachment) is not None:
+                            await outbox.send(message.channel, "Converting to MP4...")
+                    elif attachment.filename.lower().endswith(".dem"):
+                        jobs.job_queue.enqueue("demo", message, attachment)
                 
-                print(f"{username}: '{user_message}' [{channel}] with ({message.attachments})")
+                botlog.chat(f"{username}: '{user_message}' [{channel}] with ({message.attachments})",
+                            latency_ms=round((time.perf_counter() - start) * 1000, 3), **message_fields(message))
         except:
             pass
         
+        # =================================================================
+        # DEMO COMMAND
+        # =================================================================
+        
+        if lower_message.startswith("demo++"):
+            await handle_demo_command(message, user_message)
+        
         # =================================================================
         # WR COMMAND
         # =================================================================
@@ -627,14 +1269,26 @@ def run_discord_bot():
             try:
                 await handle_wr_command(client, message, user_message)
             except Exception as e:
-                print(responses.print_colour("R", str(e)))
-                await message.channel.send("i no no wanna :(")
+                botlog.error(str(e))
+                await outbox.send(message.channel, "i no no wanna :(")
         
         # Log message
         if not message.attachments:
-            print(f"{username}: '{user_message}' [{channel}]")
+            botlog.chat(f"{username}: '{user_message}' [{channel}]",
+                        latency_ms=round((time.perf_counter() - start) * 1000, 3), **message_fields(message))
         
         # Handle other responses
         await send_message(message, user_message)
 
+    return client
+
+
+def run_discord_bot():
+    """Initialize and run the Discord bot."""
+    global connect_start
+    
+    botlog.setup_logging()
+    client = create_client()
+    
+    connect_start = time.perf_counter()
     client.run(os.getenv("DISCORD_TOKEN"))
@@ -0,0 +1,152 @@
+"""
+PortalBot Logging
+
+This module contains helpers for:
+- Queue-backed logging with a background writer thread
+- Structured JSON line output
+- The coloured console output used by print_colour
+- Sampling of the per-message chat log
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+import metrics
+import responses
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+# console = coloured text like print_colour, json = one JSON object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "console").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Optional file that always receives JSON lines, on top of stdout
+LOG_FILE = os.getenv("LOG_FILE", "")
+# Fraction of chat messages that get logged (1.0 = all of them)
+CHAT_LOG_SAMPLE_RATE = float(os.getenv("CHAT_LOG_SAMPLE_RATE", "1.0"))
+# Records waiting for the writer thread, new records are dropped once full
+LOG_QUEUE_SIZE = 10000
+
+logger = logging.getLogger("portalbot")
+chat_logger = logging.getLogger("portalbot.chat")
+
+_listener = None
+
+
+# =============================================================================
+# FORMATTERS AND FILTERS
+# =============================================================================
+
+class JsonFormatter(logging.Formatter):
+    """Format records as a single JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ColourFormatter(logging.Formatter):
+    """Format records the same way print_colour did."""
+
+    def format(self, record):
+        text = record.getMessage()
+        colour = getattr(record, "colour", None)
+        if colour is None and record.levelno >= logging.ERROR:
+            colour = "R"
+        if colour is None:
+            return text
+        return responses.print_colour(colour, text)
+
+
+class SampleFilter(logging.Filter):
+    """Let through roughly rate of all records."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment("log_dropped")
+
+
+# =============================================================================
+# SETUP
+# =============================================================================
+
+def setup_logging():
+    """
+    Route all portalbot logging through a queue to a background writer thread.
+
+    Handlers only pay for putting a record on the queue, the formatting
+    and stdout/file writes happen on the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else ColourFormatter())
+    handlers = [stream_handler]
+
+    if LOG_FILE:
+        file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    logger.addHandler(DroppingQueueHandler(log_queue))
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    chat_logger.addFilter(SampleFilter(CHAT_LOG_SAMPLE_RATE))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+# =============================================================================
+# LOGGING HELPERS
+# =============================================================================
+
+def info(event, **fields):
+    """Log a process/info event (blue on the console)."""
+    logger.info(event, extra={"fields": fields, "colour": "B"})
+
+
+def success(event, **fields):
+    """Log a success event (green on the console)."""
+    logger.info(event, extra={"fields": fields, "colour": "G"})
+
+
+def error(event, **fields):
+    """Log an error event (red on the console)."""
+    logger.error(event, extra={"fields": fields, "colour": "R"})
+
+
+def chat(event, **fields):
+    """Log a chat message, subject to CHAT_LOG_SAMPLE_RATE."""
+    chat_logger.info(event, extra={"fields": fields})
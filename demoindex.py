@@ -0,0 +1,134 @@
+"""
+PortalBot Demo Index
+
+This module contains the searchable store of parsed demos:
+- Every parsed demo is recorded once, keyed by the SHA-256 of the file
+- Map and player columns are indexed for search
+- Answers demo++ search/best without re-parsing anything
+"""
+
+import os
+import sqlite3
+import time
+
+from discord.utils import escape_mentions
+
+import ticks
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+BASE_PATH = os.getenv("BASE_PATH", os.path.dirname(os.path.abspath(__file__)))
+DEMO_INDEX_PATH = os.getenv("DEMO_INDEX_PATH", f"{BASE_PATH}/demos.sqlite3")
+
+# Most demos listed by a search
+MAX_SEARCH_RESULTS = 10
+
+# Sorts after any character, so [prefix, prefix + PREFIX_END) is a prefix range
+PREFIX_END = "\U0010ffff"
+
+# NOCASE columns make the prefix ranges below case insensitive and indexed
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS demos (
+    content_hash TEXT PRIMARY KEY,
+    map_name TEXT NOT NULL COLLATE NOCASE,
+    client_name TEXT NOT NULL COLLATE NOCASE,
+    server_name TEXT NOT NULL,
+    game_directory TEXT NOT NULL,
+    playback_ticks INTEGER NOT NULL,
+    playback_time REAL NOT NULL,
+    measured_ticks INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    guild_id INTEGER,
+    link TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS demos_map ON demos (map_name, measured_ticks);
+CREATE INDEX IF NOT EXISTS demos_player ON demos (client_name, measured_ticks);
+"""
+
+
+def clean(value):
+    """Header strings are fixed width and padded with null bytes."""
+    return value.split("\0", 1)[0].strip()
+
+
+# =============================================================================
+# DEMO INDEX
+# =============================================================================
+
+class DemoIndex:
+    """SQLite-backed index of parsed demos."""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.row_factory = sqlite3.Row
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def get(self, content_hash):
+        """Get a demo by the hash of its file, or None if it hasn't been parsed."""
+        return self.db.execute("SELECT * FROM demos WHERE content_hash = ?", (content_hash,)).fetchone()
+
+    def add(self, content_hash, demo, filename, guild_id=None, link=None):
+        """
+        Record a parsed demo.
+
+        Args:
+            content_hash: SHA-256 hex digest of the demo file
+            demo: demoparser.Demo filled in by parse_demo()
+            filename: Name the demo was posted as
+            guild_id: Guild it was posted in
+            link: Jump URL of the message the demo was posted in
+
+        Returns:
+            False if the demo was already indexed
+        """
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO demos (content_hash, map_name, client_name, server_name, game_directory, "
+                "playback_ticks, playback_time, measured_ticks, filename, guild_id, link, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, clean(demo.map_name), clean(demo.client_name), clean(demo.server_name),
+                 clean(demo.game_directory), demo.playback_ticks, demo.playback_time, len(demo.ticks),
+                 filename, guild_id, link, time.time()),
+            )
+        return bool(cursor.rowcount)
+
+    def search_map(self, name, limit=MAX_SEARCH_RESULTS):
+        """Fastest demos on maps starting with name."""
+        return self.db.execute(
+            "SELECT * FROM demos WHERE map_name >= ? AND map_name < ? ORDER BY measured_ticks LIMIT ?",
+            (name, name + PREFIX_END, limit),
+        ).fetchall()
+
+    def search_player(self, name, limit=MAX_SEARCH_RESULTS):
+        """Fastest demos recorded by players whose name starts with name."""
+        return self.db.execute(
+            "SELECT * FROM demos WHERE client_name >= ? AND client_name < ? ORDER BY measured_ticks LIMIT ?",
+            (name, name + PREFIX_END, limit),
+        ).fetchall()
+
+    def best(self, map_name):
+        """Fastest demo on exactly map_name, or None."""
+        return self.db.execute(
+            "SELECT * FROM demos WHERE map_name = ? ORDER BY measured_ticks LIMIT 1", (map_name,)
+        ).fetchone()
+
+
+demo_index = DemoIndex(DEMO_INDEX_PATH)
+
+
+def format_demo(row):
+    """One line description of an indexed demo."""
+    # Names come straight out of the demo file, don't let them ping anyone
+    line = (f"`{escape_mentions(row['map_name'])}` by **{escape_mentions(row['client_name'])}** - "
+            f"{ticks.format_ticks(row['measured_ticks'])} ({ticks.plural_ticks(row['measured_ticks'])})")
+    return f"{line} <{row['link']}>" if row["link"] else line
@@ -5,7 +5,9 @@
 
 import struct
 from discord import Embed
-import responses
+import botlog
+import ticks
+import metrics
 
 class Reader:
 	def __init__(self, data) -> None:
@@ -67,14 +69,16 @@ class Parser:
 		self.demo = Demo()
 
 
-	def parse_demo(self):
+	@metrics.timed("demo_parse")
+	def parse_demo(self) -> bool:
+		"""Parse the demo, returns True only if it was read up to its STOP packet."""
 		try:
 			# check file stamp
 			self.demo.file_stamp = self.reader.read_string(8)
 			if self.demo.file_stamp != "HL2DEMO\0":
-				print(f"{self.demo.file_stamp}")
+				botlog.error(f"Invalid demo file stamp {self.demo.file_stamp!r}")
 				self.demo = Demo()
-				return
+				return False
 
 			self.demo.demo_protocol = self.reader.read_int(4)
 			self.demo.network_protocol = self.reader.read_int(4)
@@ -105,18 +109,20 @@ class Parser:
 	# 				file.write(f"{value}\n")
 	# 			file.close()
 
+			# set lookup, checking the list for every packet is quadratic
+			seen_ticks = set()
+			stopped = False
 			while self.reader.index < len(self.reader.data):
 				packet_type = self.reader.read_int(1)
 				tick = self.reader.read_int(4)
-				if tick not in self.demo.ticks and tick >= 0:
+				if tick not in seen_ticks and tick >= 0:
+					seen_ticks.add(tick)
 					self.demo.ticks.append(tick)
-					with open("./demo_info/archive_demo_info.txt", "a") as file:
-						file.write(f"{tick}\n")
-						
 
 				match packet_type:
 					case 7:
 						# STOP packet
+						stopped = True
 						break
 					case 1 | 2:
 						# SINGON packet
@@ -147,31 +153,20 @@ class Parser:
 						# STRINGTABLES packet
 						# will most likely not be useful here
 						self.reader.skip(self.reader.read_int(4))
-			file.close()
 		except Exception as e:
-			print(responses.print_colour("R", f"Error parsing demo: {e}"))
+			botlog.error(f"Error parsing demo: {e}")
+			return False
+
+		if not stopped:
+			# ran out of data first, the demo is cut short
+			botlog.error("Demo ended without a STOP packet")
+		return stopped
 
 
 	def generate_embed(self, filename: str) -> Embed:
-		total_ticks = 0
-		with open("./demo_info/archive_demo_info.txt", "r") as file:
-			for line in file.readlines():
-				total_ticks += 1
-			print(responses.print_colour("B", f"{total_ticks}"))
-		ticks_len = total_ticks
-		seconds = ticks_len * 0.015
-		minutes = round(seconds // 60)
-		if minutes == 0:
-			time_str = str(seconds)
-			if len(time_str.split(".")[1]) == 2:
-				time_str += "0"
-		else:
-			if seconds - minutes * 60 < 10:
-				time_str = str(minutes) + ":0" + str(seconds - minutes * 60)
-			else:
-				time_str = str(minutes) + ":" + str(seconds - minutes * 60)
-			if len(time_str.split(".")[1]) == 2:
-				time_str += "0"
+		# measured from this demo's packets, parsed demos are kept in demoindex
+		ticks_len = len(self.demo.ticks)
+		time_str = ticks.format_ticks(ticks_len)
 
 		res_embed = Embed(title=f"Successfully parsed {filename}!", color=0x00ff00)
 		# dont display file stamp cause its just HL2DEMO for every demo
@@ -0,0 +1,168 @@
+"""
+PortalBot Flood Guard
+
+This module contains the spam and raid detection for on_message:
+- Per-user message counts, to catch one account spamming
+- Per-content counts, to catch many accounts posting the same invite or
+  mass ping
+- Counts live in small time-bucketed ring buffers, so each message is a
+  fixed amount of work and memory is capped by the LRU size
+"""
+
+import re
+import time
+from collections import OrderedDict
+
+import metrics
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+# Messages per user allowed inside the window before they are timed out
+USER_WINDOW = 10  # seconds
+USER_BUCKETS = 10
+
+# Copies of the same message allowed inside the window across a guild. Only
+# messages with an invite or mass ping count, so a chat full of "gg", the same
+# GIF or the WR video link never looks like a raid
+CONTENT_WINDOW = 30  # seconds
+CONTENT_BUCKETS = 10
+
+# Most users and message contents tracked at once, the idlest are dropped
+MAX_TRACKED_USERS = 10000
+MAX_TRACKED_CONTENTS = 10000
+
+# Invite codes are swapped for a placeholder so raids rotating codes still match
+INVITE_PATTERN = re.compile(r"(?:discord(?:app)?\.com/invite|discord\.gg)/\S+", re.IGNORECASE)
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+
+# What raid messages are posted for: invites and mass pings. Plain links and
+# pinging a single user are left out, everyone congratulating a runner shares
+# the same GIF or video link and pings them.
+RAID_CONTENT_PATTERN = re.compile(r"discord(?:app)?\.com/invite|discord\.gg/|<@&\d+>|@everyone|@here", re.IGNORECASE)
+
+# Bot commands are often repeated by different people (stats++, cube++), they
+# still count towards a user's spam limit but never look like a raid
+COMMAND_PATTERN = re.compile(r"^\S+(?:\+\+|--)")
+
+
+# =============================================================================
+# RING COUNTER
+# =============================================================================
+
+class RingCounter:
+    """
+    Event count over a sliding window, kept in a ring of time buckets.
+
+    The window is split into a fixed number of buckets. Each bucket
+    remembers which time slot it holds, so a stale bucket is reset when
+    its slot comes round again instead of being cleared on a timer.
+    """
+
+    __slots__ = ("bucket_seconds", "counts", "slots")
+
+    def __init__(self, window, buckets):
+        self.bucket_seconds = window / buckets
+        self.counts = [0] * buckets
+        self.slots = [-1] * buckets
+
+    def add(self, now):
+        """Count one event at time now and return the total inside the window."""
+        slot = int(now / self.bucket_seconds)
+        buckets = len(self.counts)
+        index = slot % buckets
+        if self.slots[index] != slot:
+            self.slots[index] = slot
+            self.counts[index] = 0
+        self.counts[index] += 1
+
+        oldest = slot - buckets
+        return sum(count for count, bucket_slot in zip(self.counts, self.slots) if bucket_slot > oldest)
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+
+
+class CounterLRU:
+    """Ring counters keyed by anything, least recently used dropped first."""
+
+    def __init__(self, window, buckets, max_size):
+        self.window = window
+        self.buckets = buckets
+        self.max_size = max_size
+        self._counters = OrderedDict()
+
+    def add(self, key, now):
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = RingCounter(self.window, self.buckets)
+            self._counters[key] = counter
+            if len(self._counters) > self.max_size:
+                self._counters.popitem(last=False)
+                metrics.increment("floodguard_evictions")
+        else:
+            self._counters.move_to_end(key)
+        return counter.add(now)
+
+    def reset(self, key):
+        counter = self._counters.get(key)
+        if counter is not None:
+            counter.reset()
+
+    def __len__(self):
+        return len(self._counters)
+
+
+# =============================================================================
+# FLOOD GUARD
+# =============================================================================
+
+def normalize_content(content):
+    """Reduce a message to the form used for duplicate detection."""
+    content = INVITE_PATTERN.sub("invite", content.casefold())
+    return NON_WORD_PATTERN.sub("", content)
+
+
+class FloodGuard:
+    """Sliding-window spam (per user) and raid (per content) detection."""
+
+    def __init__(self):
+        self.users = CounterLRU(USER_WINDOW, USER_BUCKETS, MAX_TRACKED_USERS)
+        self.contents = CounterLRU(CONTENT_WINDOW, CONTENT_BUCKETS, MAX_TRACKED_CONTENTS)
+
+    def check(self, guild_id, user_id, content, user_limit, content_limit, now=None):
+        """
+        Count a message and check it against the limits.
+
+        Args:
+            guild_id: Guild the message was sent in
+            user_id: Author's ID
+            content: Message text
+            user_limit: Messages per USER_WINDOW allowed from one user
+            content_limit: Copies per CONTENT_WINDOW allowed of one message with
+                an invite or mass ping
+
+        Returns:
+            "spam" or "raid" if a limit was passed, otherwise None
+        """
+        if now is None:
+            now = time.monotonic()
+
+        user_key = (guild_id, user_id)
+        if self.users.add(user_key, now) > user_limit:
+            # Start them again so one burst is one timeout
+            self.users.reset(user_key)
+            metrics.increment("floodguard_spam")
+            return "spam"
+
+        if COMMAND_PATTERN.match(content) or not RAID_CONTENT_PATTERN.search(content):
+            return None
+
+        if self.contents.add((guild_id, hash(normalize_content(content))), now) > content_limit:
+            metrics.increment("floodguard_raid")
+            return "raid"
+        return None
+
+
+flood_guard = FloodGuard()
@@ -0,0 +1,154 @@
+"""
+PortalBot Guild Configuration
+
+This module contains the per-guild configuration registry:
+- Channel IDs, pin threshold, flood limits, privileged roles and term lists per guild
+- O(1) lookup by guild ID, falling back to the defaults
+- Hot reload when the config file changes, no restart needed
+"""
+
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+import botlog
+
+load_dotenv()
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+BASE_PATH = os.getenv("BASE_PATH", os.path.dirname(os.path.abspath(__file__)))
+GUILD_CONFIG_PATH = os.getenv("GUILD_CONFIG_PATH", f"{BASE_PATH}/guild_config.json")
+
+# Minimum seconds between checks of the config file's modification time
+CONFIG_CHECK_INTERVAL = 2.0
+
+
+def env_terms(name):
+    """Read a comma separated term list from the environment."""
+    return [term for term in os.getenv(name, "").split(",") if term]
+
+
+# =============================================================================
+# GUILD CONFIG
+# =============================================================================
+
+class GuildConfig:
+    """Settings for one guild, with any missing values taken from the defaults."""
+
+    def __init__(self, guild_id, settings):
+        self.guild_id = guild_id
+        self.name = settings.get("name", "")
+        self.pin_channel_id = settings.get("pin_channel_id")
+        self.wr_channel_id = settings.get("wr_channel_id")
+        self.mod_log_channel_id = settings.get("mod_log_channel_id")
+        self.reaction_pin_threshold = int(settings.get("reaction_pin_threshold", 10))
+        self.flood_user_limit = int(settings.get("flood_user_limit", 8))
+        self.flood_content_limit = int(settings.get("flood_content_limit", 5))
+        self.privileged_roles = frozenset(settings.get("privileged_roles", []))
+        self.privileged_role_ids = frozenset(int(role_id) for role_id in settings.get("privileged_role_ids", []))
+        self.dox_terms = tuple(term for term in settings.get("dox_terms", []) if term)
+        self.timeout_terms = tuple(term for term in settings.get("timeout_terms", []) if term)
+        self.cube_enabled = bool(settings.get("cube_enabled", False))
+        self.emergency_exit_enabled = bool(settings.get("emergency_exit_enabled", False))
+
+
+class GuildConfigRegistry:
+    """
+    Registry of GuildConfig objects keyed by guild ID.
+
+    The file is re-read whenever its modification time changes, checked at
+    most every CONFIG_CHECK_INTERVAL seconds. If a reload fails the previous
+    config is kept. version goes up on every successful reload so caches
+    built from the config know when to start again.
+    """
+
+    def __init__(self, path, check_interval=CONFIG_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.version = 0
+        self._mtime = None
+        self._next_check = 0.0
+        self._default = GuildConfig(None, self._env_defaults())
+        self._configs = {}
+
+    def _env_defaults(self):
+        return {"dox_terms": env_terms("DOX_TERMS"), "timeout_terms": env_terms("TIMEOUT_TERMS")}
+
+    def reload(self):
+        """Load the config file and rebuild every guild's config."""
+        mtime = None
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            mtime, data = None, {}
+        except (OSError, json.JSONDecodeError) as e:
+            # Don't retry a broken file every check, wait for it to change again
+            self._mtime = mtime
+            botlog.error(f"Failed to load guild config, keeping previous config: {e}")
+            return False
+
+        try:
+            defaults = self._env_defaults()
+            defaults.update(data.get("defaults", {}))
+            configs = {}
+            for guild_id, settings in data.get("guilds", {}).items():
+                configs[int(guild_id)] = GuildConfig(int(guild_id), {**defaults, **settings})
+            default = GuildConfig(None, defaults)
+        except (ValueError, TypeError, AttributeError) as e:
+            self._mtime = mtime
+            botlog.error(f"Invalid guild config, keeping previous config: {e}")
+            return False
+
+        self._default = default
+        self._configs = configs
+        self._mtime = mtime
+        self.version += 1
+        botlog.success(f"Loaded config for {len(configs)} guild{'' if len(configs) == 1 else 's'}")
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if self.version == 0 or mtime != self._mtime:
+            self.reload()
+
+    def get(self, guild_id):
+        """
+        Get the config for a guild.
+
+        Args:
+            guild_id: Guild ID (int or str), or None for DMs
+
+        Returns:
+            GuildConfig for the guild, or the defaults if it isn't listed
+        """
+        self._maybe_reload()
+        if guild_id is None:
+            return self._default
+        return self._configs.get(int(guild_id), self._default)
+
+    def guild_ids(self):
+        """IDs of every guild with its own config."""
+        self._maybe_reload()
+        return list(self._configs)
+
+
+registry = GuildConfigRegistry(GUILD_CONFIG_PATH)
+
+
+def get(guild_id):
+    """Get the config for a guild from the shared registry."""
+    return registry.get(guild_id)
@@ -0,0 +1,262 @@
+"""
+PortalBot Image Screening
+
+This module contains the perceptual hash check for posted images:
+- aHash and dHash are computed off the event loop in a small thread pool
+- Blocked images are kept in a moderator-managed blocklist file
+- Lookups go through a BK-tree, so near matches are found without
+  comparing against every blocked image
+"""
+
+import asyncio
+import importlib
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import botlog
+import metrics
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+BASE_PATH = os.getenv("BASE_PATH", os.path.dirname(os.path.abspath(__file__)))
+IMAGE_BLOCKLIST_PATH = os.getenv("IMAGE_BLOCKLIST_PATH", f"{BASE_PATH}/image_blocklist.json")
+
+# Maximum differing bits (out of 64) for an image to count as a match.
+# dHash finds the candidates, aHash has to agree as well.
+DHASH_THRESHOLD = 10
+AHASH_THRESHOLD = 12
+
+# Images bigger than this aren't downloaded for screening
+IMAGE_SCREEN_MAX_SIZE = 10 * 1024 * 1024
+
+# Decoding is CPU bound, keep it off the event loop without starving it
+HASH_WORKERS = 2
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp")
+
+
+# =============================================================================
+# HASHING
+# =============================================================================
+
+def image_hashes(data):
+    """
+    Compute the aHash and dHash of an image, blocking.
+
+    Args:
+        data: Raw image file bytes
+
+    Returns:
+        (ahash, dhash) as 64-bit ints
+    """
+    # Pillow comes with moviepy, import it on first use like moviepy itself
+    Image = importlib.import_module("PIL.Image")
+    with Image.open(io.BytesIO(data)) as image:
+        # Lets JPEGs decode at a fraction of their size, we only need 9x8
+        image.draft("L", (64, 64))
+        grey = image.convert("L")
+
+    small = list(grey.resize((8, 8), Image.Resampling.LANCZOS).getdata())
+    mean = sum(small) / 64
+    ahash = 0
+    for pixel in small:
+        ahash = (ahash << 1) | (pixel > mean)
+
+    wide = list(grey.resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            dhash = (dhash << 1) | (wide[row * 9 + col] > wide[row * 9 + col + 1])
+    return ahash, dhash
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes."""
+    return (a ^ b).bit_count()
+
+
+# =============================================================================
+# BK-TREE
+# =============================================================================
+
+class BKTree:
+    """
+    BK-tree over 64-bit hashes using Hamming distance.
+
+    Each child is keyed by its distance to the parent, so by the triangle
+    inequality a search only has to visit children whose key is within
+    threshold of the query's distance to the parent.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, items, {distance: child}]
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, threshold):
+        """
+        Find every item whose hash is within threshold bits of value.
+
+        Returns:
+            List of (distance, item)
+        """
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= threshold:
+                found.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - threshold <= child_distance <= distance + threshold:
+                    stack.append(child)
+        return found
+
+
+# =============================================================================
+# BLOCKLIST
+# =============================================================================
+
+class ImageBlocklist:
+    """
+    Moderator-managed list of blocked image hashes.
+
+    Entries are stored as hex strings in a JSON file, written with a temp
+    file and rename like the cube counter. The BK-tree is rebuilt from the
+    entries whenever the list changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        self._tree = BKTree()
+        self._executor = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self._load()
+            self._rebuild()
+        return self._entries
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, json.JSONDecodeError) as e:
+            botlog.error(f"Failed to load image blocklist: {e}")
+            return []
+
+    def _write(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def _rebuild(self):
+        self._tree = BKTree()
+        for entry in self._entries:
+            self._tree.add(int(entry["dhash"], 16), entry)
+
+    async def hash_image(self, data):
+        """Hash an image in the screening thread pool."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="imagescreen")
+        with metrics.timer("image_hash"):
+            return await asyncio.get_running_loop().run_in_executor(self._executor, image_hashes, data)
+
+    def match(self, ahash, dhash):
+        """
+        Look up an image's hashes in the blocklist.
+
+        Returns:
+            The closest matching entry, or None
+        """
+        candidates = self._tree.search(dhash, DHASH_THRESHOLD) if self.entries else []
+        for distance, entry in sorted(candidates, key=lambda candidate: candidate[0]):
+            if hamming(ahash, int(entry["ahash"], 16)) <= AHASH_THRESHOLD:
+                return entry
+        return None
+
+    def add(self, ahash, dhash, added_by, note=""):
+        """Block an image, returns False if it was already blocked."""
+        if any(entry["dhash"] == f"{dhash:016x}" for entry in self.entries):
+            return False
+        entry = {"ahash": f"{ahash:016x}", "dhash": f"{dhash:016x}", "added_by": added_by, "note": note}
+        self._entries.append(entry)
+        self._tree.add(dhash, entry)
+        self._write()
+        return True
+
+    def remove(self, dhash_hex):
+        """Unblock an image by its dHash hex string, returns True if it was found."""
+        remaining = [entry for entry in self.entries if entry["dhash"] != dhash_hex.lower()]
+        if len(remaining) == len(self._entries):
+            return False
+        self._entries = remaining
+        self._rebuild()
+        self._write()
+        return True
+
+
+blocklist = ImageBlocklist(IMAGE_BLOCKLIST_PATH)
+
+
+def is_image(attachment):
+    """Check if an attachment looks like an image we can screen."""
+    content_type = getattr(attachment, "content_type", None) or ""
+    return content_type.startswith("image/") or attachment.filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+async def screen_attachments(attachments):
+    """
+    Check a message's images against the blocklist.
+
+    Args:
+        attachments: The message's attachments
+
+    Returns:
+        The first matching blocklist entry, or None
+    """
+    if not blocklist.entries:
+        return None
+
+    for attachment in attachments:
+        if not is_image(attachment) or attachment.size > IMAGE_SCREEN_MAX_SIZE:
+            continue
+        try:
+            ahash, dhash = await blocklist.hash_image(await attachment.read())
+        except Exception as e:
+            botlog.error(f"Couldn't screen {attachment.filename}: {e}")
+            continue
+        entry = blocklist.match(ahash, dhash)
+        if entry is not None:
+            metrics.increment("image_screen_matches")
+            return entry
+    return None
@@ -0,0 +1,257 @@
+"""
+PortalBot Job Queue
+
+This module contains a durable queue for slow attachment work (MKV
+conversions, demo parses):
+- Jobs are stored in SQLite, so a restart or crash doesn't lose them
+- Unfinished jobs are picked up again when the bot starts
+- The same attachment is never queued twice, and identical content that
+  was already processed gets a link to the earlier result instead
+- Queue depth and job ages are exposed for stats++ and metrics
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+import botlog
+import metrics
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+BASE_PATH = os.getenv("BASE_PATH", os.path.dirname(os.path.abspath(__file__)))
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", f"{BASE_PATH}/jobs.sqlite3")
+
+# Jobs that fail this many times are given up on
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    guild_id INTEGER,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    attachment_url TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL UNIQUE,
+    content_hash TEXT,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at);
+CREATE INDEX IF NOT EXISTS jobs_content ON jobs (kind, content_hash);
+"""
+
+
+# =============================================================================
+# JOB QUEUE
+# =============================================================================
+
+class Job:
+    """One row of the jobs table."""
+
+    def __init__(self, row):
+        self.id = row["id"]
+        self.kind = row["kind"]
+        self.guild_id = row["guild_id"]
+        self.channel_id = row["channel_id"]
+        self.message_id = row["message_id"]
+        self.attachment_url = row["attachment_url"]
+        self.filename = row["filename"]
+        self.content_hash = row["content_hash"]
+        self.state = row["state"]
+        self.attempts = row["attempts"]
+        self.output = row["output"]
+        self.created_at = row["created_at"]
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with one worker pool per job kind.
+
+    Handlers are registered per kind with register() and are called as
+    handler(client, job). Whatever they return is stored as the job's
+    output (the bot stores a link to the result message). Failed jobs are
+    retried up to MAX_ATTEMPTS times before on_failure is called.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._handlers = {}
+        self._queues = {}
+        self._workers = []
+        self._client = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.row_factory = sqlite3.Row
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def register(self, kind, handler, workers=1, on_failure=None):
+        """
+        Register the coroutine that processes a kind of job.
+
+        Args:
+            kind: Job kind, e.g. "mkv"
+            handler: async handler(client, job) returning the job output
+            workers: How many jobs of this kind may run at once
+            on_failure: Optional async on_failure(client, job, error) once a job gives up
+        """
+        self._handlers[kind] = (handler, workers, on_failure)
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self.db:
+            self.db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(row) if row else None
+
+    def enqueue(self, kind, message, attachment):
+        """
+        Record a job for an attachment and hand it to a worker.
+
+        Args:
+            kind: Job kind, must have a registered handler
+            message: Message the attachment was posted in
+            attachment: The attachment to process
+
+        Returns:
+            The new job's ID, or None if that attachment is already queued
+        """
+        # CDN URLs carry expiring signature parameters, the path is stable
+        dedupe_key = f"{kind}:{urlsplit(attachment.url).path}"
+        now = time.time()
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO jobs (kind, guild_id, channel_id, message_id, attachment_url, filename, "
+                "dedupe_key, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, message.guild.id if message.guild else None, message.channel.id, message.id,
+                 attachment.url, attachment.filename, dedupe_key, now, now),
+            )
+        if not cursor.rowcount:
+            metrics.increment("jobs_deduplicated")
+            return None
+
+        job_id = cursor.lastrowid
+        metrics.increment(f"jobs_{kind}_queued")
+        if kind in self._queues:
+            self._queues[kind].put_nowait(job_id)
+        return job_id
+
+    def record_content(self, job, content_hash):
+        """
+        Store a job's content hash and look for an earlier identical job.
+
+        Returns:
+            Output of a finished job with the same content, or None
+        """
+        self._update(job.id, content_hash=content_hash)
+        row = self.db.execute(
+            "SELECT output FROM jobs WHERE kind = ? AND content_hash = ? AND state = 'done' AND id != ? "
+            "AND output IS NOT NULL ORDER BY id DESC LIMIT 1",
+            (job.kind, content_hash, job.id),
+        ).fetchone()
+        return row["output"] if row else None
+
+    def start(self, client):
+        """Start the workers and resume any jobs left over from the last run."""
+        if self._client is not None:
+            return
+        self._client = client
+
+        # Anything still "running" was interrupted by a restart
+        with self.db:
+            resumed = self.db.execute("UPDATE jobs SET state = 'queued' WHERE state = 'running'").rowcount
+
+        for kind, (handler, workers, on_failure) in self._handlers.items():
+            queue = asyncio.Queue()
+            self._queues[kind] = queue
+            for row in self.db.execute("SELECT id FROM jobs WHERE kind = ? AND state = 'queued' ORDER BY id", (kind,)):
+                queue.put_nowait(row["id"])
+            for _ in range(workers):
+                self._workers.append(asyncio.create_task(self._work(kind, handler, on_failure, queue)))
+
+        pending = sum(queue.qsize() for queue in self._queues.values())
+        if pending:
+            botlog.info(f"Resuming {pending} queued job{'' if pending == 1 else 's'} ({resumed} interrupted)")
+
+    async def _work(self, kind, handler, on_failure, queue):
+        while True:
+            job = self.get(await queue.get())
+            if job is None or job.state != "queued":
+                continue
+
+            self._update(job.id, state="running", attempts=job.attempts + 1)
+            metrics.observe(f"job_{kind}_wait", time.time() - job.created_at)
+            try:
+                with metrics.timer(f"job_{kind}"):
+                    output = await handler(self._client, job)
+            except Exception as e:
+                botlog.error(f"Job {job.id} ({kind}) failed: {e}", job=job.id, attempt=job.attempts + 1)
+                if job.attempts + 1 >= MAX_ATTEMPTS:
+                    self._update(job.id, state="failed", error=str(e))
+                    if on_failure is not None:
+                        try:
+                            await on_failure(self._client, job, e)
+                        except Exception as failure_error:
+                            botlog.error(f"Job {job.id} failure handler failed: {failure_error}", job=job.id)
+                else:
+                    self._update(job.id, state="queued", error=str(e))
+                    queue.put_nowait(job.id)
+                continue
+            self._update(job.id, state="done", output=output, error=None)
+
+    def stats(self):
+        """
+        Queue depth and job ages for capacity planning.
+
+        Returns:
+            Dict of state -> (count, oldest job age in seconds)
+        """
+        now = time.time()
+        rows = self.db.execute("SELECT state, COUNT(*) AS count, MIN(created_at) AS oldest FROM jobs GROUP BY state")
+        return {row["state"]: (row["count"], now - row["oldest"]) for row in rows}
+
+    def summary(self):
+        """One line description of the queue for stats++."""
+        stats = self.stats()
+        queued, queued_age = stats.get("queued", (0, 0))
+        running, running_age = stats.get("running", (0, 0))
+        failed = stats.get("failed", (0, 0))[0]
+        return (f"jobs: {queued} queued (oldest {queued_age:.0f}s), {running} running "
+                f"(oldest {running_age:.0f}s), {failed} failed")
+
+
+job_queue = JobQueue(JOBS_DB_PATH)
+
+
+def queue_depth():
+    """Number of jobs waiting or running, for the metrics endpoint."""
+    stats = job_queue.stats()
+    return stats.get("queued", (0, 0))[0] + stats.get("running", (0, 0))[0]
+
+
+def oldest_job_age():
+    """Age in seconds of the oldest unfinished job, for the metrics endpoint."""
+    stats = job_queue.stats()
+    return max(stats.get("queued", (0, 0))[1], stats.get("running", (0, 0))[1])
+
+
+metrics.register_gauge("jobs_depth", queue_depth)
+metrics.register_gauge("jobs_oldest_age_seconds", oldest_job_age)
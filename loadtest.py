@@ -0,0 +1,375 @@
+"""
+PortalBot Offline Load Tester
+
+Runs the bot's real event handlers against a fake Discord gateway so
+changes can be benchmarked without a live server:
+- Fake guilds, channels, roles, members and messages
+- Synthetic on_message / on_raw_reaction_add traffic at a configurable rate
+- Outbound sends are recorded instead of hitting the API
+- Reports p50/p99 handler latency, event loop lag and throughput
+
+Usage:
+    python loadtest.py --rate 200 --duration 30 --mix chat=70,pin=20,tick2time=10
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+SOURCE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Files copied into the scratch BASE_PATH so a run never touches real data
+DATA_FILES = ["wr_archive.json", "cube_count.txt", "guild_config.json", "pinnerino/pinnerino_message_ids.txt"]
+
+DEFAULT_MIX = "chat=70,pin=10,tick2time=7,time2tick=7,wr_search=2,cube=2,stats=2"
+
+SAMPLE_TIMES = ["17.445", "1:01.560", "7:27.195", "1", "12:00.400", "59.985", "1:05.01"]
+SAMPLE_TICKS = ["1163", "4104", "29813", "66", "240000", "1"]
+SAMPLE_WR_SEARCHES = ["name Msushi", "category inb", "year 2022", "category g"]
+SAMPLE_CHAT = ["gg", "nice run", "what category is this", "4104 moment", "pb!", "lol", "how do I do the skip"]
+
+snowflakes = itertools.count(1200000000000000000)
+
+
+# =============================================================================
+# FAKE DISCORD OBJECTS
+# =============================================================================
+
+class FakeRole:
+    def __init__(self, name):
+        self.id = next(snowflakes)
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class FakeGuild:
+    def __init__(self, guild_id, name):
+        self.id = guild_id
+        self.name = name
+        self.filesize_limit = 25 * 1024 * 1024
+        self.shard_id = 0
+        self.roles = []
+
+
+class FakeUser:
+    def __init__(self, harness, name, guild=None, roles=()):
+        self.harness = harness
+        self.id = next(snowflakes)
+        self.name = name
+        self.guild = guild
+        self.roles = list(roles)
+        self.mention = f"<@{self.id}>"
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, content=None, **kwargs):
+        return await self.harness.record_send(f"dm:{self.name}", content, kwargs)
+
+    async def ban(self, reason=None):
+        await self.harness.rest_call("ban")
+
+    async def timeout(self, until, reason=None):
+        await self.harness.rest_call("timeout")
+
+
+class FakeChannel:
+    def __init__(self, harness, channel_id, name, guild):
+        self.harness = harness
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, content=None, **kwargs):
+        return await self.harness.record_send(f"#{self.name}", content, kwargs)
+
+    async def fetch_message(self, message_id):
+        await self.harness.rest_call("fetch_message")
+        return self.harness.messages[message_id]
+
+
+class FakeReaction:
+    def __init__(self, emoji, count=0):
+        self.emoji = emoji
+        self.count = count
+
+
+class FakeMessage:
+    def __init__(self, harness, author, channel, content):
+        self.harness = harness
+        self.id = next(snowflakes)
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.attachments = []
+        self.reactions = []
+
+    async def reply(self, content=None, **kwargs):
+        return await self.harness.record_send(f"#{self.channel.name}", content, kwargs)
+
+    async def delete(self):
+        await self.harness.rest_call("delete")
+
+    async def add_reaction(self, emoji):
+        await self.harness.rest_call("add_reaction")
+
+
+class FakeHTTP:
+    """Stands in for client.http so REST instrumentation has something to wrap."""
+
+    async def request(self, route, **kwargs):
+        return None
+
+
+class FakeClient:
+    """Minimal stand-in for discord.Client used by bot.create_client."""
+
+    def __init__(self, harness, intents=None, max_messages=1000, **options):
+        self.harness = harness
+        self.intents = intents
+        self.http = FakeHTTP()
+        self.user = FakeUser(harness, "PortalBot")
+        self.cached_messages = deque(maxlen=max_messages)
+        self.guilds = [harness.guild]
+        self.shard_id = None
+        self.latency = 0.0
+
+    def event(self, coro):
+        setattr(self, coro.__name__, coro)
+        return coro
+
+    def get_channel(self, channel_id):
+        return self.harness.get_channel(channel_id)
+
+    async def fetch_user(self, user_id):
+        await self.harness.rest_call("fetch_user")
+        return self.harness.users[0]
+
+    async def change_presence(self, **kwargs):
+        pass
+
+
+# =============================================================================
+# HARNESS
+# =============================================================================
+
+class LoadTest:
+    """Generates synthetic traffic and feeds it to the registered handlers."""
+
+    def __init__(self, bot, rest_latency, hot_messages, channels):
+        self.bot = bot
+        self.rest_latency = rest_latency
+        # Pretend to be the first configured guild so guild-only commands run
+        guild_ids = bot.guild_config.registry.guild_ids()
+        config = bot.guild_config.get(guild_ids[0] if guild_ids else None)
+        self.guild = FakeGuild(guild_ids[0] if guild_ids else next(snowflakes), config.name or "Guild")
+        self.guild.roles = [FakeRole(name) for name in ["Member"] + sorted(config.privileged_roles)]
+        self.channels = {}
+        self.messages = {}
+        self.sent = []
+        self.rest_calls = defaultdict(int)
+        self.latencies = defaultdict(list)
+        self.client = bot.create_client(lambda **options: FakeClient(self, **options))
+
+        self.text_channels = [self.get_channel(next(snowflakes), f"channel{i}") for i in range(channels)]
+        self.users = [
+            FakeUser(self, f"runner{i}", self.guild, [self.guild.roles[0]] + ([self.guild.roles[1]] if i % 10 == 0 else []))
+            for i in range(50)
+        ]
+
+        # Popular messages that pin reactions pile onto, deliberately left
+        # out of the client's message cache so the fetch path is exercised
+        self.hot_messages = []
+        for i in range(hot_messages):
+            message = FakeMessage(self, random.choice(self.users), random.choice(self.text_channels), f"clip {i}")
+            message.reactions.append(FakeReaction("📌"))
+            self.messages[message.id] = message
+            self.hot_messages.append(message)
+
+    def get_channel(self, channel_id, name=None):
+        if channel_id not in self.channels:
+            self.channels[channel_id] = FakeChannel(self, channel_id, name or str(channel_id), self.guild)
+        return self.channels[channel_id]
+
+    async def rest_call(self, name):
+        self.rest_calls[name] += 1
+        if self.rest_latency:
+            await asyncio.sleep(self.rest_latency)
+
+    async def record_send(self, destination, content, kwargs):
+        await self.rest_call("send")
+        self.sent.append((destination, content, kwargs))
+
+    # -------------------------------------------------------------------------
+    # Event generators
+    # -------------------------------------------------------------------------
+
+    def make_message(self, kind):
+        if kind == "tick2time":
+            content = f"tick2time++ {random.choice(SAMPLE_TICKS)}"
+        elif kind == "time2tick":
+            content = f"time2tick++ {random.choice(SAMPLE_TIMES)}"
+        elif kind == "wr_search":
+            content = f"wr++ search {random.choice(SAMPLE_WR_SEARCHES)}"
+        elif kind == "cube":
+            content = random.choice(["cube++", "cube--"])
+        elif kind == "stats":
+            content = "stats++"
+        else:
+            content = random.choice(SAMPLE_CHAT)
+
+        author = self.users[0] if kind == "cube" else random.choice(self.users)
+        message = FakeMessage(self, author, random.choice(self.text_channels), content)
+        self.messages[message.id] = message
+        self.client.cached_messages.append(message)
+        return message
+
+    def make_pin_payload(self):
+        message = random.choice(self.hot_messages)
+        message.reactions[0].count += 1
+        return SimpleNamespace(
+            message_id=message.id,
+            channel_id=message.channel.id,
+            guild_id=self.guild.id,
+            user_id=random.choice(self.users).id,
+            emoji=SimpleNamespace(name="📌"),
+        )
+
+    async def dispatch(self, kind):
+        start = time.perf_counter()
+        try:
+            if kind == "pin":
+                await self.client.on_raw_reaction_add(self.make_pin_payload())
+            else:
+                await self.client.on_message(self.make_message(kind))
+        except Exception as e:
+            self.latencies[f"{kind} (errors)"].append(0.0)
+            print(f"{kind} handler raised {e!r}")
+        self.latencies[kind].append(time.perf_counter() - start)
+
+    async def run(self, rate, duration, mix):
+        kinds, weights = zip(*mix.items())
+        lag_monitor = asyncio.create_task(self.bot.metrics.monitor_event_loop(0.05))
+        tasks = []
+
+        start = time.perf_counter()
+        for i in range(int(rate * duration)):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind = random.choices(kinds, weights)[0]
+            tasks.append(asyncio.create_task(self.dispatch(kind)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+        lag_monitor.cancel()
+        return len(tasks), elapsed
+
+
+# =============================================================================
+# REPORTING
+# =============================================================================
+
+def percentile(values, q):
+    """Exact percentile of a list of latencies."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def print_report(test, events, elapsed):
+    all_latencies = [value for values in test.latencies.values() for value in values]
+    print(f"\n{events} events in {elapsed:.2f}s ({events / elapsed:.1f} events/s)")
+    print(f"{'handler':<20}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind, values in sorted(test.latencies.items()) + [("all", all_latencies)]:
+        print(f"{kind:<20}{len(values):>8}{percentile(values, 0.5) * 1000:>10.2f}"
+              f"{percentile(values, 0.99) * 1000:>10.2f}{max(values, default=0) * 1000:>10.2f}")
+
+    lag = test.bot.metrics.histograms["event_loop_lag"]
+    print(f"\nevent loop lag: p50 <{lag.quantile(0.5) * 1000:.0f}ms, p99 <{lag.quantile(0.99) * 1000:.0f}ms, "
+          f"mean {lag.total / max(lag.count, 1) * 1000:.2f}ms over {lag.count} samples")
+    print(f"outbound sends: {len(test.sent)} ({test.bot.metrics.counters['outbox_merged']} messages merged)")
+    print("REST calls: " + ", ".join(f"{name}={count}" for name, count in sorted(test.rest_calls.items())))
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test PortalBot's handlers offline.")
+    parser.add_argument("--rate", type=float, default=50, help="events per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of traffic")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma separated kind=weight pairs")
+    parser.add_argument("--rest-latency", type=float, default=50, help="simulated REST round trip in ms")
+    parser.add_argument("--hot-messages", type=int, default=20, help="messages pin reactions are spread over")
+    parser.add_argument("--channels", type=int, default=10, help="channels traffic is spread over")
+    parser.add_argument("--route-rate", type=float, default=None,
+                        help="override the outbox's sends per 5 seconds per destination")
+    parser.add_argument("--flood-guard", action="store_true",
+                        help="keep the flood limits, by default they are lifted since a few fake users post a lot")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    # Point the bot at a scratch copy of its data and keep the logs quiet
+    # before it is imported, its paths are read at import time
+    scratch = tempfile.mkdtemp(prefix="portalbot-loadtest-")
+    for name in DATA_FILES:
+        os.makedirs(os.path.dirname(os.path.join(scratch, name)), exist_ok=True)
+        shutil.copy(os.path.join(SOURCE_PATH, name), os.path.join(scratch, name))
+    if not args.flood_guard:
+        config_path = os.path.join(scratch, "guild_config.json")
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        config.setdefault("defaults", {}).update(flood_user_limit=10 ** 9, flood_content_limit=10 ** 9)
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+    os.environ["BASE_PATH"] = scratch
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    import bot
+    bot.botlog.setup_logging()
+
+    async def run():
+        if args.route_rate:
+            bot.outbox.outbox.rate = args.route_rate
+        test = LoadTest(bot, args.rest_latency / 1000, args.hot_messages, args.channels)
+        events, elapsed = await test.run(args.rate, args.duration, parse_mix(args.mix))
+        print_report(test, events, elapsed)
+
+    try:
+        asyncio.run(run())
+    finally:
+        # Write-behind state would otherwise be flushed into a deleted directory
+        bot.responses.cube_counter.flush_now()
+        bot.pinned_messages.flush_now()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import time
+
+import_start = time.perf_counter()
+
 import bot
 
 # -----------------------------
@@ -5,4 +9,5 @@ import bot
 # -----------------------------
 
 if __name__ == "__main__":
+    bot.startup_times["import"] = time.perf_counter() - import_start
     bot.run_discord_bot()
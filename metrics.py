@@ -0,0 +1,276 @@
+"""
+PortalBot Metrics
+
+This module contains helpers for:
+- Per-command counters and latency histograms
+- Event loop lag and REST call timing
+- Process memory
+- Prometheus-style text output and the stats++ summary
+"""
+
+import asyncio
+import functools
+import inspect
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# How often the event loop lag monitor wakes up, in seconds
+LOOP_LAG_INTERVAL = 0.5
+
+
+# =============================================================================
+# METRIC TYPES
+# =============================================================================
+
+class Histogram:
+    """Fixed-bucket latency histogram."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        """Record one observation."""
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q):
+        """
+        Estimate a quantile from the buckets.
+
+        Args:
+            q: Quantile between 0 and 1
+
+        Returns:
+            Upper bound of the bucket containing the quantile, in seconds
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+counters = defaultdict(int)
+histograms = defaultdict(Histogram)
+gauges = {}
+
+
+def increment(name, amount=1):
+    """Increase a counter."""
+    counters[name] += amount
+
+
+def register_gauge(name, func):
+    """Register a function whose current value is reported as a gauge."""
+    gauges[name] = func
+
+
+def observe(name, seconds):
+    """Record a latency observation in seconds."""
+    histograms[name].observe(seconds)
+
+
+@contextmanager
+def timer(name):
+    """
+    Time a block of code.
+
+    Records the latency under name, counts calls as "<name>_total" and
+    failures as "<name>_errors".
+    """
+    start = time.perf_counter()
+    increment(f"{name}_total")
+    try:
+        yield
+    except BaseException:
+        increment(f"{name}_errors")
+        raise
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator version of timer() for plain and async functions."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timer(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# =============================================================================
+# EVENT LOOP AND REST MONITORING
+# =============================================================================
+
+async def monitor_event_loop(interval=LOOP_LAG_INTERVAL):
+    """Measure how late the event loop wakes up from a sleep, forever."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        observe("event_loop_lag", max(time.perf_counter() - start - interval, 0.0))
+
+
+def instrument_http(client):
+    """
+    Time every REST call made by a discord.py client.
+
+    Wraps the client's HTTP request method so each call is recorded under
+    "rest <METHOD> <route>", using the route template so IDs don't create
+    a new metric per message.
+    """
+    http = client.http
+    request = http.request
+
+    @functools.wraps(request)
+    async def timed_request(route, **kwargs):
+        with timer(f"rest {route.method} {route.path}"):
+            return await request(route, **kwargs)
+
+    http.request = timed_request
+
+
+def resident_memory():
+    """
+    Resident memory of the bot process.
+
+    Returns:
+        Bytes, or None if the platform doesn't report it. Where /proc isn't
+        available this is the peak rather than the current size.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes everywhere except macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+register_gauge("process_resident_memory_bytes", resident_memory)
+
+
+# =============================================================================
+# OUTPUT
+# =============================================================================
+
+def metric_name(name):
+    """Turn a metric name into a valid Prometheus identifier."""
+    return "".join(c if c.isalnum() else "_" for c in name).strip("_").lower()
+
+
+def render_prometheus():
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Returns:
+        Multi-line string
+    """
+    lines = []
+    for name, value in sorted(counters.items()):
+        lines.append(f"portalbot_{metric_name(name)} {value}")
+    for name, func in sorted(gauges.items()):
+        try:
+            value = func()
+        except Exception:
+            # A broken gauge shouldn't take the whole endpoint down
+            continue
+        if value is not None:
+            lines.append(f"portalbot_{metric_name(name)} {value}")
+    for name, histogram in sorted(histograms.items()):
+        base = f"portalbot_{metric_name(name)}_seconds"
+        cumulative = 0
+        for bucket, bucket_count in zip(histogram.buckets, histogram.counts):
+            cumulative += bucket_count
+            lines.append(f'{base}_bucket{{le="{bucket}"}} {cumulative}')
+        lines.append(f'{base}_bucket{{le="+Inf"}} {histogram.count}')
+        lines.append(f"{base}_sum {histogram.total}")
+        lines.append(f"{base}_count {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+def render_summary():
+    """
+    Render a short per-handler summary for the stats++ command.
+
+    Returns:
+        Discord-ready string
+    """
+    lines = []
+    for name, histogram in sorted(histograms.items(), key=lambda item: -item[1].total):
+        errors = counters.get(f"{name}_errors", 0)
+        lines.append(
+            f"{name}: {histogram.count} calls, avg {histogram.total / histogram.count * 1000:.1f}ms, "
+            f"p50 <{histogram.quantile(0.5) * 1000:.0f}ms, p99 <{histogram.quantile(0.99) * 1000:.0f}ms"
+            + (f", {errors} errors" if errors else "")
+        )
+    if not lines:
+        return "No stats recorded yet!"
+    return "**Bot Stats**\n```\n" + "\n".join(lines)[:1900] + "\n```"
+
+
+async def serve_metrics(host, port):
+    """
+    Serve render_prometheus() over plain HTTP for local scraping.
+
+    Args:
+        host: Interface to listen on
+        port: TCP port
+
+    Returns:
+        The running asyncio server
+    """
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        body = render_prometheus().encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4\r\n"
+            + f"Content-Length: {len(body)}\r\n".encode()
+            + b"Connection: close\r\n\r\n"
+            + body
+        )
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, host, port)
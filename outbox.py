@@ -0,0 +1,175 @@
+"""
+PortalBot Outbound Send Queue
+
+This module contains the outbound message scheduler:
+- One queue per destination, so sends to a channel or DM go out in order
+- Plain text messages waiting for the same destination are merged
+- Each destination is paced by a token bucket so bursts don't hit 429s
+"""
+
+import asyncio
+import time
+from collections import deque
+
+import discord
+
+import botlog
+import metrics
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+# Discord allows roughly 5 messages per 5 seconds per channel
+ROUTE_RATE = 5
+ROUTE_PER = 5.0
+
+# Longest message Discord accepts, merged messages are kept under this
+MAX_MESSAGE_LENGTH = 2000
+
+# Idle per-destination buckets are pruned once there are more than this many
+MAX_IDLE_BUCKETS = 1000
+
+
+# =============================================================================
+# SEND QUEUE
+# =============================================================================
+
+class TokenBucket:
+    """Simple token bucket allowing rate sends every per seconds."""
+
+    def __init__(self, rate=ROUTE_RATE, per=ROUTE_PER):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self):
+        """Seconds to wait before the next send is allowed."""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.per / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        """Stop all sends for a while, used after a 429."""
+        self.blocked_until = time.monotonic() + seconds
+        self.tokens = 0.0
+
+
+class PendingSend:
+    def __init__(self, destination, content, kwargs):
+        self.destination = destination
+        self.content = content
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+
+    @property
+    def mergeable(self):
+        # Only plain text can be folded into another message
+        return not self.kwargs and self.content is not None
+
+
+class Outbox:
+    """Per-destination send queues with merging and rate limiting."""
+
+    def __init__(self, rate=ROUTE_RATE, per=ROUTE_PER):
+        self.rate = rate
+        self.per = per
+        self._queues = {}
+        self._buckets = {}
+        self._workers = {}
+
+    def send(self, destination, content=None, **kwargs):
+        """
+        Queue a message for a channel, user or member.
+
+        Args:
+            destination: Anything with an async send() (channel, user, member)
+            content: Message text
+            **kwargs: Passed through to send() (embed, file, files, reference...)
+
+        Returns:
+            Future resolving to the sent discord.Message
+        """
+        key = destination.id
+        pending = PendingSend(destination, None if content is None else str(content), kwargs)
+        self._queues.setdefault(key, deque()).append(pending)
+        metrics.increment("outbox_queued")
+
+        worker = self._workers.get(key)
+        if worker is None or worker.done():
+            self._workers[key] = asyncio.create_task(self._drain(key))
+        return pending.future
+
+    def take_batch(self, queue):
+        """Pop the next message plus any plain text that can be merged into it."""
+        batch = [queue.popleft()]
+        if not batch[0].mergeable:
+            return batch
+        length = len(batch[0].content)
+        while queue and queue[0].mergeable and length + 1 + len(queue[0].content) <= MAX_MESSAGE_LENGTH:
+            length += 1 + len(queue[0].content)
+            batch.append(queue.popleft())
+        return batch
+
+    async def _drain(self, key):
+        queue = self._queues[key]
+        bucket = self._buckets.setdefault(key, TokenBucket(self.rate, self.per))
+
+        while queue:
+            delay = bucket.delay()
+            if delay > 0:
+                metrics.observe("outbox_wait", delay)
+                await asyncio.sleep(delay)
+                continue
+
+            batch = self.take_batch(queue)
+            bucket.take()
+            first = batch[0]
+            content = "\n".join(item.content for item in batch) if len(batch) > 1 else first.content
+            if len(batch) > 1:
+                metrics.increment("outbox_merged", len(batch) - 1)
+
+            try:
+                with metrics.timer("outbox_send"):
+                    message = await first.destination.send(content, **first.kwargs)
+            except Exception as e:
+                if isinstance(e, discord.HTTPException) and e.status == 429:
+                    bucket.block(getattr(e, "retry_after", None) or self.per)
+                botlog.error(f"Send failed: {e}", destination=key)
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                continue
+
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_result(message)
+
+        del self._queues[key]
+        self._workers.pop(key, None)
+        if len(self._buckets) > MAX_IDLE_BUCKETS:
+            self._prune_buckets()
+
+    def _prune_buckets(self):
+        # A bucket with nothing queued and a full set of tokens holds no state
+        for key, bucket in list(self._buckets.items()):
+            if key not in self._queues and bucket.delay() == 0 and bucket.tokens >= bucket.rate:
+                del self._buckets[key]
+
+
+outbox = Outbox()
+
+
+def send(destination, content=None, **kwargs):
+    """Queue a message on the shared outbox, see Outbox.send."""
+    return outbox.send(destination, content, **kwargs)
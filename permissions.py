@@ -0,0 +1,218 @@
+"""
+PortalBot Permissions
+
+This module contains the privileged role check:
+- Privileged roles are resolved to role IDs once per guild
+- Per-member results are cached with a TTL
+- Role and member events invalidate the affected entries
+- Roles matched by name are remembered, so renaming one keeps it privileged
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import time
+from collections import OrderedDict
+
+import botlog
+import guild_config
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+BASE_PATH = os.getenv("BASE_PATH", os.path.dirname(os.path.abspath(__file__)))
+# Which role each configured role name last matched, runtime state kept out
+# of the tracked guild config
+ROLE_STATE_PATH = os.getenv("ROLE_STATE_PATH", f"{BASE_PATH}/privileged_roles_state.json")
+
+PERMISSION_CACHE_TTL = 5 * 60  # seconds
+PERMISSION_CACHE_SIZE = 5000
+
+
+# =============================================================================
+# PERMISSION CACHE
+# =============================================================================
+
+class PermissionCache:
+    """
+    Cache of privileged role IDs per guild and privileged results per member.
+
+    The guild config is the only source of truth: a role is privileged if
+    its ID is in privileged_role_ids, or if it has, or last had, one of the
+    names in privileged_roles. The role each name last matched is saved to
+    a state file off the event loop, so a renamed role stays privileged
+    (across restarts too) for as long as its old name is still configured. Resolved IDs and
+    member results are dropped whenever the config is reloaded.
+    """
+
+    def __init__(self, ttl=PERMISSION_CACHE_TTL, max_size=PERMISSION_CACHE_SIZE, state_path=ROLE_STATE_PATH):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.state_path = state_path
+        self._config_version = None
+        self._role_ids = {}  # guild_id -> frozenset of role IDs
+        self._members = OrderedDict()  # (guild_id, member_id) -> (privileged, expires_at)
+        self._matched = None  # guild_id -> {role name: role ID}, loaded on first use
+        self._save_task = None
+        self._dirty = False
+
+    def _check_config_version(self):
+        if self._config_version != guild_config.registry.version:
+            self._config_version = guild_config.registry.version
+            self._role_ids.clear()
+            self._members.clear()
+
+    # -------------------------------------------------------------------------
+    # Matched role state
+    # -------------------------------------------------------------------------
+
+    @property
+    def matched(self):
+        if self._matched is None:
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._matched = {int(guild_id): {name: int(role_id) for name, role_id in names.items()}
+                                 for guild_id, names in data.items()}
+            except FileNotFoundError:
+                self._matched = {}
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                botlog.error(f"Failed to load privileged role state, matching by name again: {e}")
+                self._matched = {}
+        return self._matched
+
+    def _write_state(self, data):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.state_path)
+
+    def _schedule_save(self):
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save_now()
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save())
+
+    async def _save(self):
+        # Keep going until a write finishes with nothing changed during it
+        while self._dirty:
+            self._dirty = False
+            data = {str(guild_id): dict(names) for guild_id, names in self.matched.items()}
+            try:
+                await asyncio.to_thread(self._write_state, data)
+            except OSError as e:
+                botlog.error(f"Failed to save privileged role state: {e}")
+
+    def save_now(self):
+        """Write the matched role state straight away, used at shutdown."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        try:
+            self._write_state({str(guild_id): dict(names) for guild_id, names in self._matched.items()})
+        except OSError as e:
+            botlog.error(f"Failed to save privileged role state: {e}")
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+
+    def resolve_roles(self, guild, deleted_role_id=None):
+        """
+        Work out which of a guild's role IDs are privileged.
+
+        Args:
+            guild: Guild whose roles to match against the config
+            deleted_role_id: Role that was just deleted, never matched
+
+        Returns:
+            frozenset of privileged role IDs
+        """
+        config = guild_config.get(guild.id)
+        existing_ids = {role.id for role in guild.roles} - {deleted_role_id}
+        saved = self.matched.get(guild.id, {})
+
+        matched = {}
+        for role in guild.roles:
+            if role.name in config.privileged_roles and role.id in existing_ids:
+                matched[role.name] = role.id
+        # Names that no longer match anything follow the role they last matched
+        for name in config.privileged_roles - matched.keys():
+            if saved.get(name) in existing_ids:
+                matched[name] = saved[name]
+
+        missing = config.privileged_roles - matched.keys()
+        if missing and not config.privileged_role_ids:
+            botlog.error(f"Privileged roles not found in {guild}: {', '.join(sorted(missing))}", guild=guild.id)
+
+        # Names dropped from the config are forgotten with it
+        if matched != saved:
+            self.matched[guild.id] = matched
+            self._schedule_save()
+        return frozenset(config.privileged_role_ids | set(matched.values()))
+
+    def privileged_role_ids(self, guild):
+        """Get the privileged role IDs for a guild, resolving them on first use."""
+        self._check_config_version()
+        role_ids = self._role_ids.get(guild.id)
+        if role_ids is None:
+            role_ids = self.resolve_roles(guild)
+            self._role_ids[guild.id] = role_ids
+        return role_ids
+
+    def is_privileged(self, member):
+        """
+        Check if a member has any of their guild's privileged roles.
+
+        Args:
+            member: Guild member (users outside a guild are never privileged)
+
+        Returns:
+            True if the member has a privileged role
+        """
+        guild = getattr(member, "guild", None)
+        if guild is None:
+            return False
+
+        self._check_config_version()
+        key = (guild.id, member.id)
+        entry = self._members.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self._members.move_to_end(key)
+            return entry[0]
+
+        role_ids = self.privileged_role_ids(guild)
+        privileged = not role_ids.isdisjoint(role.id for role in member.roles)
+        self._members[key] = (privileged, time.monotonic() + self.ttl)
+        self._members.move_to_end(key)
+        while len(self._members) > self.max_size:
+            self._members.popitem(last=False)
+        return privileged
+
+    def invalidate_member(self, guild_id, member_id):
+        """Forget a member's cached result, e.g. after their roles change."""
+        self._members.pop((guild_id, member_id), None)
+
+    def refresh_guild(self, guild, deleted_role_id=None):
+        """Re-resolve a guild's roles after a role is created, edited or deleted."""
+        self._check_config_version()
+        self._role_ids[guild.id] = self.resolve_roles(guild, deleted_role_id)
+        for key in [key for key in self._members if key[0] == guild.id]:
+            del self._members[key]
+
+
+permission_cache = PermissionCache()
+atexit.register(permission_cache.save_now)
+
+
+def is_privileged(member):
+    """Check a member against the shared permission cache."""
+    return permission_cache.is_privileged(member)
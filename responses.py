@@ -8,21 +8,25 @@ This module contains helper functions for:
 - Console colored output
 """
 
+import asyncio
+import atexit
 import os
+import botlog
+import guild_config
+import permissions
 from dotenv import load_dotenv
 
 load_dotenv()
 
-DOX_TERMS = os.getenv("DOX_TERMS", "").split(",") if os.getenv("DOX_TERMS") else []
-
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
 
 BASE_PATH = os.getenv("BASE_PATH", os.path.dirname(os.path.abspath(__file__)))
 CUBE_COUNT_PATH = f"{BASE_PATH}/cube_count.txt"
-P1SR_SERVER_ID = "305456639530500096"
-PRIVILEGED_ROLES = ["Community contributor", "SRC verifier", "Moderation Team", "Admin"]
+CUBE_FLUSH_DELAY = 5  # seconds
+# A steady stream of cube++ still gets written at least this often
+CUBE_FLUSH_MAX_DELAY = 30  # seconds
 
 # Category display names
 CATEGORY_NAMES = {
@@ -38,16 +42,126 @@ CATEGORY_NAMES = {
 # CUBE COUNT HANDLERS
 # =============================================================================
 
+class CubeCounter:
+    """
+    In-memory cube count with write-behind persistence.
+
+    Changes are applied in memory straight away and written to disk after
+    CUBE_FLUSH_DELAY seconds of quiet (each change restarts the wait, up to
+    CUBE_FLUSH_MAX_DELAY after the first unsaved change), or at shutdown. Writes go to a temp
+    file which is then renamed over the real one, so the file is never left
+    half written.
+    """
+
+    def __init__(self, path, flush_delay, max_delay=CUBE_FLUSH_MAX_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.max_delay = max_delay
+        self._flush_at = 0.0
+        self._deadline = 0.0
+        self._count = None
+        self._dirty = False
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+
+    def _load(self):
+        """Read the count from disk, treating a missing or empty file as 0."""
+        try:
+            with open(self.path, "r") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            botlog.error(f"Invalid cube count in {self.path}, starting from 0")
+            return 0
+
+    def _write(self, count):
+        """Atomically replace the count file."""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(str(count))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = self._load()
+        return self._count
+
+    def set(self, count):
+        """Set the count and schedule a flush."""
+        self._count = count
+        self._dirty = True
+        self._schedule_flush()
+        return count
+
+    def add(self, amount):
+        """Change the count by amount and return the new value."""
+        return self.set(self.count + amount)
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not running inside the bot, write straight away
+            self.flush_now()
+            return
+        now = loop.time()
+        if self._flush_task is None or self._flush_task.done():
+            self._deadline = now + self.max_delay
+            self._flush_at = now + self.flush_delay
+            self._flush_task = loop.create_task(self._flush_later())
+        else:
+            # Push the pending write back, the task picks up the new time
+            self._flush_at = min(now + self.flush_delay, self._deadline)
+
+    async def _flush_later(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while (remaining := self._flush_at - loop.time()) > 0:
+                await asyncio.sleep(remaining)
+            await self.flush()
+            if not self._dirty:
+                return
+            # Changed while writing (or the write failed), debounce it again
+            now = loop.time()
+            self._deadline = now + self.max_delay
+            self._flush_at = now + self.flush_delay
+
+    async def flush(self):
+        """Write the current count to disk off the event loop."""
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, self._count)
+            except OSError as e:
+                self._dirty = True
+                botlog.error(f"Failed to save cube count: {e}")
+
+    def flush_now(self):
+        """Write the current count to disk synchronously (used at shutdown)."""
+        if not self._dirty:
+            return
+        self._write(self._count)
+        self._dirty = False
+
+
+cube_counter = CubeCounter(CUBE_COUNT_PATH, CUBE_FLUSH_DELAY)
+atexit.register(cube_counter.flush_now)
+
+
 def get_cube_count():
-    """Read current cube count from file."""
-    with open(CUBE_COUNT_PATH, "r") as f:
-        return int(f.read().strip())
+    """Get the current cube count."""
+    return cube_counter.count
 
 
 def set_cube_count(count):
-    """Write cube count to file."""
-    with open(CUBE_COUNT_PATH, "w") as f:
-        f.write(str(count))
+    """Set the cube count, persisted in the background."""
+    cube_counter.set(count)
 
 
 def handle_response(user_data, message):
@@ -61,27 +175,23 @@ def handle_response(user_data, message):
     Returns:
         Response string if command was handled, False otherwise
     """
-    try:
-        message_server_id = str(user_data.guild.id)
-    except:
+    if user_data.guild is None:
         return False
     
-    if message_server_id != P1SR_SERVER_ID:
+    config = guild_config.get(user_data.guild.id)
+    if not config.cube_enabled:
         return False
     
     # Check for privileged role
-    has_permission = any(str(role) in PRIVILEGED_ROLES for role in user_data.author.roles)
-    if not has_permission:
+    if not permissions.is_privileged(user_data.author):
         return False
     
     if message == "cube++":
-        count = get_cube_count() + 1
-        set_cube_count(count)
+        count = cube_counter.add(1)
         return f"So many cubes! I've now seen {count} cubes!"
     
     if message == "cube--":
-        count = get_cube_count() - 1
-        set_cube_count(count)
+        count = cube_counter.add(-1)
         return f"I was mistaken, cube rescinded. I've now seen only {count} cubes!"
     
     return False
@@ -91,33 +201,39 @@ def handle_response(user_data, message):
 # DOX DETECTION
 # =============================================================================
 
-def text_dox_blox(message):
+def text_dox_blox(message, terms=None):
     """
     Check if message contains any dox terms.
     
     Args:
         message: String to check
+        terms: Dox terms to look for, defaults to the default guild config's
     
     Returns:
         True if dox term found, False otherwise
     """
-    for term in DOX_TERMS:
+    if terms is None:
+        terms = guild_config.get(None).dox_terms
+    for term in terms:
         if term and term in message:
             return True
     return False
 
 
-def name_dox_blox(username):
+def name_dox_blox(username, terms=None):
     """
     Check if username contains any dox terms.
     
     Args:
         username: Username string to check
+        terms: Dox terms to look for, defaults to the default guild config's
     
     Returns:
         True if dox term found, False otherwise
     """
-    for term in DOX_TERMS:
+    if terms is None:
+        terms = guild_config.get(None).dox_terms
+    for term in terms:
         if term and term in username:
             return True
     return False
@@ -209,6 +325,31 @@ def print_colour(colour, text):
     return f"{colour_code}{text}{reset}"
 
 
+ERROR_CODES = {
+    "000": "Error 000: Unclassified Error",
+    "201": "Error 201: ESC sequence found in message.",
+    "301": "Error 301: Dox Detected in message.",
+    "302": "Error 302: Dox Detected in name.",
+    "303": "Error 303: Dox Detected in image.",
+    "304": "Error 304: Ping Detected in message.",
+    "305": "Error 305: Timeout Term in message.",
+    "306": "Error 306: Flood Detected in messages.",
+}
+
+
+def error_message(code):
+    """
+    Get the plain error message for a code.
+    
+    Args:
+        code: Error code string (e.g., "301")
+    
+    Returns:
+        Error message without colour codes
+    """
+    return ERROR_CODES.get(code, f"Error {code}: Unknown error")
+
+
 def print_error(code):
     """
     Get formatted error message by code.
@@ -219,15 +360,4 @@ def print_error(code):
     Returns:
         Red-colored error message
     """
-    error_codes = {
-        "000": "Error 000: Unclassified Error",
-        "201": "Error 201: ESC sequence found in message.",
-        "301": "Error 301: Dox Detected in message.",
-        "302": "Error 302: Dox Detected in name.",
-        "303": "Error 303: Dox Detected in image.",
-        "304": "Error 304: Ping Detected in message.",
-        "305": "Error 305: Timeout Term in message.",
-    }
-    
-    message = error_codes.get(code, f"Error {code}: Unknown error")
-    return print_colour("R", message)
+    return print_colour("R", error_message(code))
@@ -1,77 +1,263 @@
-import math
-
-def minute_checker(time):
-    convertedSeconds = 0.0
-    time = time.split(":")
-    timecount = len(time)-1
-    for i in time:
-        convertedSeconds += float(i)*(pow(60,timecount))
-        timecount-=1
-    if convertedSeconds > 86400:
-        return False
-    return round(float(convertedSeconds)/0.015,3)
-
-def second_to_minute(time):
-    if time >= 60:
-        seconds = round(time % 60, 3)
-        if seconds < 10:
-            seconds = f"0{seconds}"
-
-        while len(str(seconds)) <= 5:
-            seconds = f"{seconds}0"
-
-        minutes = int(time // 60)
-        if minutes >= 60:
-            hours = minutes // 60
-            minutes = minutes % 60
-            if minutes < 10:
-                minutes = "0"+str(minutes)
-            return f"{hours}:{minutes}:{seconds}"
-        return f"{minutes}:{seconds}"
-       
-    else:
-        if time < 10:
-            while len(str(time)) <= 4:
-                time = f"{time}0"
-        else:
-            while len(str(time)) <= 5:
-                time = f"{time}0"
+import re
+from fractions import Fraction
+from functools import lru_cache
+
+import botlog
+import metrics
+
+# -----------------------------
+#   EXACT TICK ARITHMETIC
+# -----------------------------
+
+# All arithmetic is done on integers, times are kept in milliseconds
+# and one tick is exactly 15ms, so there are no float rounding artefacts
+
+TICK_MS = 15
+
+# Longest time accepted by time2tick++ / tick2time++
+MAX_TIME_MS = 86400 * 1000
+MAX_TICK_TIME_MS = 2678400 * 1000
+
+# Number of distinct inputs remembered by each command's response cache
+CONVERSION_CACHE_SIZE = 1024
+
+# Either side of the decimal point may be left out (".5", "5."), but not both
+TIME_PATTERN = re.compile(r"^(?=\.?\d)(\d+(:\d+){0,2})?(\.\d*)?$")
+TICK_PATTERN = re.compile(r"^-?\d+$")
+
+
+def parse_time(time):
+    # Parse "h:mm:ss.fff" style times into (value, scale),
+    # where value / scale is the time in seconds
+    time = time.strip()
+    if not TIME_PATTERN.match(time):
+        raise ValueError(f"'{time}' is not a valid time")
+    whole, _, fraction = time.partition(".")
+    seconds = 0
+    for part in whole.split(":") if whole else []:
+        seconds = seconds * 60 + int(part)
+    scale = 10 ** len(fraction)
+    return seconds * scale + int(fraction or 0), scale
+
+
+def time_to_seconds(time):
+    # Parse a time into an exact Fraction of seconds, so every way of
+    # writing the same time ("60", "1:00", "1:00.000") gives the same value
+    if isinstance(time, Fraction):
+        return time
+    return Fraction(*parse_time(str(time)))
+
+
+def time_to_ms(time):
+    # Parse a time into whole milliseconds, rejecting sub-millisecond times
+    value, scale = parse_time(time)
+    ms, remainder = divmod(value * 1000, scale)
+    if remainder:
+        raise ValueError(f"'{time}' is more precise than a millisecond")
+    return ms
+
+
+def split_ticks(time):
+    # Returns (ticks, exact) where ticks is the whole number of ticks in
+    # the time and exact is False if the time falls between two ticks
+    ticks, remainder = divmod(time_to_seconds(time) * 1000, TICK_MS)
+    return ticks, remainder == 0
+
 
-    return time
+def is_over_limit(time, limit_ms):
+    return time_to_seconds(time) * 1000 > limit_ms
 
 
+def ticks_to_ms(ticks):
+    return int(ticks) * TICK_MS
+
+
+def format_ms(ms):
+    # Format milliseconds as s.fff, m:ss.fff or h:mm:ss.fff
+    sign = "-" if ms < 0 else ""
+    seconds, ms = divmod(abs(ms), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{sign}{hours}:{minutes:02}:{seconds:02}.{ms:03}"
+    if minutes:
+        return f"{sign}{minutes}:{seconds:02}.{ms:03}"
+    return f"{sign}{seconds}.{ms:03}"
+
+
+def format_ticks(ticks):
+    return format_ms(ticks_to_ms(ticks))
+
+
+def normalize_time(time):
+    # Return a time in the standard format, or unchanged if it can't be parsed
+    try:
+        return format_ms(time_to_ms(time))
+    except ValueError:
+        return time
+
+
+def plural_ticks(ticks):
+    return f"{ticks} tick{'' if ticks == 1 else 's'}"
+
+
+# -----------------------------
+#   COMMAND RESPONSES
+# -----------------------------
+
+# The same values get converted over and over, so responses are cached
+# by normalised input and repeat queries are just a lookup
+
 def time_to_tick(time):
     try:
-        ticks = minute_checker(time)
-        if ticks:
-            if ticks.is_integer():
-                correctTime = second_to_minute(round((ticks)*0.015, 3))
-                return f"Your time is valid, being {int(ticks)} tick{'' if ticks == 1 else 's'} / {correctTime} seconds."
-            
-            else:
-                floor_time = second_to_minute(round(math.floor(ticks)*0.015, 3))
-                ceil_time = second_to_minute(round(math.ceil(ticks)*0.015, 3))
-                return f"That time is invalid, did you mean:\n{math.floor(ticks)} tick{'' if math.floor(ticks) == 1 else 's'} / {floor_time} seconds\n{math.ceil(ticks)} tick{'' if math.ceil(ticks) == 1 else 's'} / {ceil_time} seconds."
-        else:
+        seconds = time_to_seconds(time)
+    except ValueError:
+        # Not worth caching invalid input
+        return convert_time_to_tick(time)
+    return cached_time_to_tick(seconds)
+
+
+def tick_to_time(ticks):
+    try:
+        ticks = int(ticks)
+    except (TypeError, ValueError):
+        # Not worth caching invalid input
+        return convert_tick_to_time(ticks)
+    return cached_tick_to_time(ticks)
+
+
+def conversion_cache_stats():
+    # Hit/miss counters for the response caches
+    return {
+        "time_to_tick": cached_time_to_tick.cache_info(),
+        "tick_to_time": cached_tick_to_time.cache_info(),
+    }
+
+
+def convert_time_to_tick(time):
+    try:
+        if is_over_limit(time, MAX_TIME_MS):
             return "That is over a month long, I no no wanna :("
+
+        ticks, exact = split_ticks(time)
+        if exact:
+            return f"Your time is valid, being {plural_ticks(ticks)} / {format_ticks(ticks)} seconds."
+
+        return (f"That time is invalid, did you mean:\n"
+                f"{plural_ticks(ticks)} / {format_ticks(ticks)} seconds\n"
+                f"{plural_ticks(ticks + 1)} / {format_ticks(ticks + 1)} seconds.")
     except Exception as e:
-        print(e)
+        botlog.error(str(e))
 
 
-def tick_to_time(ticks):
+def convert_tick_to_time(ticks):
     # Convert ticks to real time
     try:
         try:
             ticks = int(ticks)
-            time = round(float(ticks) * 0.015, 3)
-            if time > 2678400:
+            ms = ticks_to_ms(ticks)
+            if ms > MAX_TICK_TIME_MS:
                 return "That is over a month long, I no no wanna :("
             if ticks == 1163:
-                return f"Your ticks in real time is {second_to_minute(time)} (:heart:)"
+                return f"Your ticks in real time is {format_ms(ms)} (:heart:)"
             if ticks == 4104:
-                return f"Your ticks in real time is {second_to_minute(time)} (<:no4104:1180929144977117364>)"
-            return f"Your ticks in real time is {second_to_minute(time)}"
+                return f"Your ticks in real time is {format_ms(ms)} (<:no4104:1180929144977117364>)"
+            return f"Your ticks in real time is {format_ms(ms)}"
         except:
             return f"'{ticks}' was not a valid tick count, please try again!"
     except Exception as e:
-        print(e)
\ No newline at end of file
+        botlog.error(str(e))
+
+
+cached_time_to_tick = lru_cache(maxsize=CONVERSION_CACHE_SIZE)(convert_time_to_tick)
+cached_tick_to_time = lru_cache(maxsize=CONVERSION_CACHE_SIZE)(convert_tick_to_time)
+
+for cache_name, cache in (("time_to_tick", cached_time_to_tick), ("tick_to_time", cached_tick_to_time)):
+    metrics.register_gauge(f"{cache_name}_cache_hits", lambda cache=cache: cache.cache_info().hits)
+    metrics.register_gauge(f"{cache_name}_cache_misses", lambda cache=cache: cache.cache_info().misses)
+
+
+def conversion_cache_summary():
+    # One line of cache hit rates for stats++
+    parts = []
+    for name, info in conversion_cache_stats().items():
+        parts.append(f"{name} {info.hits} hits / {info.misses} misses")
+    return "conversion cache: " + ", ".join(parts)
+
+
+# -----------------------------
+#   BATCH CONVERSION
+# -----------------------------
+
+# Longest reply Discord will accept in one message
+MAX_REPLY_LENGTH = 2000
+
+
+def split_values(text, pattern):
+    # Pull every value out of pasted text (split tables, comma lists, etc.)
+    # skipping anything that doesn't look like a value
+    return [value for value in re.split(r"[\s,;|]+", text) if pattern.match(value)]
+
+
+def times_to_ticks(times):
+    # Convert a list (or array) of times in one pass
+    # Returns (time, ticks, exact) tuples, ticks is None if the time is too long
+    results = []
+    for time in times:
+        time = str(time)
+        if is_over_limit(time, MAX_TIME_MS):
+            results.append((time, None, False))
+        else:
+            results.append((time, *split_ticks(time)))
+    return results
+
+
+def ticks_to_times(tick_counts):
+    # Convert a list (or array) of tick counts in one pass
+    # Returns (ticks, time) pairs, time is None if the tick count is too long
+    results = []
+    for ticks in tick_counts:
+        ticks = int(ticks)
+        ms = ticks_to_ms(ticks)
+        results.append((ticks, format_ms(ms) if ms <= MAX_TICK_TIME_MS else None))
+    return results
+
+
+def join_reply(lines):
+    # Join lines into one reply, cutting off anything over Discord's limit
+    reply = ""
+    for i, line in enumerate(lines):
+        if len(reply) + len(line) + 1 > MAX_REPLY_LENGTH - 20:
+            reply += f"...and {len(lines) - i} more"
+            break
+        reply += f"{line}\n"
+    return reply.rstrip()
+
+
+def time_to_tick_batch(times):
+    lines = []
+    total_ticks = 0
+    for time, ticks, exact in times_to_ticks(times):
+        if ticks is None:
+            lines.append(f"`{time}` is over a month long")
+        elif exact:
+            total_ticks += ticks
+            lines.append(f"`{time}` valid, {plural_ticks(ticks)}")
+        else:
+            lines.append(f"`{time}` invalid, did you mean {ticks} or {ticks + 1} ticks "
+                         f"({format_ticks(ticks)} / {format_ticks(ticks + 1)})")
+    lines.append(f"Total of valid times: {plural_ticks(total_ticks)} / {format_ticks(total_ticks)}")
+    return join_reply(lines)
+
+
+def tick_to_time_batch(tick_counts):
+    lines = []
+    total_ticks = 0
+    for ticks, time in ticks_to_times(tick_counts):
+        if time is None:
+            lines.append(f"`{ticks}` is over a month long")
+        else:
+            total_ticks += ticks
+            lines.append(f"`{ticks}` ticks is {time}")
+    lines.append(f"Total: {plural_ticks(total_ticks)} / {format_ticks(total_ticks)}")
+    return join_reply(lines)